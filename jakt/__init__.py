@@ -1,24 +1,41 @@
 import os
-from platformdirs import user_data_dir
-import yaml
+import sys
+import io
+from itertools import islice
 import json
-from random import randrange
 from datetime import datetime
 from time import time
 # import click
-
-from .timeslot import timeslot
-from .report import JaktReport
+# yaml, platformdirs and csv are imported when needed to keep startup fast
+
+from .timeslot import timeslot, TimeslotTable, splitTags
+from .report import JaktReport, PeriodReport
+from .analytics import Heatmap
+from .storage import Storage, openStorage
+from .catalog import Catalog
+from .rollup import Rollups
+from .intervals import IntervalIndex, Intervals
+from .atomic import FileLock, atomicWrite, atomicCreate
 from .exceptions import *
 
 
 class jakt:
-    def __init__(self) -> None:
+    def __init__(self, dataPath: str = None) -> None:
+        """
+        Uses the data stored in dataPath, or the users data directory if not given.
+        """
         # TODO: Read from config path and set variables
 
-        self.dataPath = user_data_dir(appname="Jakt")
+        if dataPath is None:
+            from platformdirs import user_data_dir
+
+            dataPath = user_data_dir(appname="Jakt")
+
+        self.dataPath = dataPath
 
         self.pathConfig = os.path.join(self.dataPath, "config.yml")
+        self.pathConfigCache = os.path.join(self.dataPath, "config.cache.json")
+        self.pathSocket = os.path.join(self.dataPath, "jakt.sock")
         self.pathCategories = os.path.join(self.dataPath, "categories.yml")
         self.pathProjects = os.path.join(self.dataPath, "projects.json")
         self.pathTimeslots = os.path.join(self.dataPath, "timeslots.json")
@@ -28,8 +45,7 @@ class jakt:
         if not os.path.exists(self.dataPath):
         	self.setup()
 
-        with open(self.pathConfig, "r") as f:
-            self.config = yaml.safe_load(f)
+        self.config = self.readConfig()
 
         # Check if debug mode is enabled
         # If it is, redirect file-operations to subfolder
@@ -44,6 +60,89 @@ class jakt:
             if not os.path.exists(self.dataPath):
                 self.setup(setupConfig=False)
 
+        # Backend holding the timeslots, opened on first use
+        self._storage = None
+        self._indexes = {}
+
+        # Shared while reading and exclusive while changing data, across processes
+        self.lock = FileLock(os.path.join(self.dataPath, "jakt.lock"))
+
+    @property
+    def storage(self) -> Storage:
+        """
+        Backend holding the timeslots, chosen in config
+        """
+        if self._storage is None:
+            self._storage = openStorage(
+                self.config.get("storage", "json"), self.dataPath
+            )
+
+        return self._storage
+
+    @property
+    def catalog(self) -> Catalog:
+        """
+        Catalog of projects and tags
+        """
+        return self.index("catalog.json", Catalog)
+
+    @property
+    def rollups(self) -> Rollups:
+        """
+        Daily project and tag totals
+        """
+        return self.index("rollups", Rollups)
+
+    @property
+    def intervals(self) -> Intervals:
+        """
+        Bound on timeslot length for overlap checks
+        """
+        return self.index("intervals.json", Intervals)
+
+    def index(self, filename: str, cls):
+        """
+        Returns the index of type cls stored in filename, rebuilt if it does not match storage
+        """
+        index = self._indexes.get(filename)
+        version = self.storage.version()
+
+        path = os.path.join(self.dataPath, filename)
+
+        if index is None or index.version != version:
+            # Read it again, another process may have brought it up to date
+            index = self._indexes[filename] = cls(path)
+
+        if index.version != version:
+            # Rebuilding writes the index, readers holding the shared lock must not
+            with self.lock():
+                version = self.storage.version()
+                index = self._indexes[filename] = cls(path)
+                if index.version != version:
+                    index.rebuild(self.storage.iterate(), version)
+
+        return index
+
+    def indexes(self) -> list:
+        """
+        Returns the indexes that are kept up to date with every change
+        """
+        return [self.catalog, self.rollups, self.intervals]
+
+    def change(self, write, added=(), removed=()) -> None:
+        """
+        Calls write to change storage and updates the indexes with the
+        timeslots that were added and removed.
+        """
+        with self.lock():
+            indexes = self.indexes()
+
+            write()
+
+            version = self.storage.version()
+            for index in indexes:
+                index.update(added=added, removed=removed, version=version)
+
     def setup(self, setupConfig=True) -> None:
         """
         Performs first time setup
@@ -69,7 +168,10 @@ class jakt:
             config = {
                 "remote": False,
                 "debug": False,
+                "storage": "json",
             }
+            import yaml
+
             with open(self.pathConfig, "a") as f:
                 yaml.dump(config, f, default_flow_style=True)
 
@@ -82,54 +184,68 @@ class jakt:
         if os.path.exists(self.pathCurrent):
             raise JaktActiveError
 
-        if tags == ():
+        if not tags:
             tags = ["<no tags>"]
 
-        ts = timeslot(
-            ID=self.generateUniqueID(),
-            start=round(time()),
-            end=None,
-            project=project,
-            tags=tags
-        )
+        with self.lock():
+            ts = timeslot(
+                ID=self.generateUniqueID(),
+                start=round(time()),
+                end=None,
+                project=project,
+                tags=tags
+            )
 
-        with open(self.pathCurrent, "w") as f:
-            f.write(str(ts.toDictString()))
-            f.close()
+            # Fails if another process started a timeslot in the meantime
+            if not atomicCreate(self.pathCurrent, str(ts.toDictString())):
+                raise JaktActiveError
 
         return ts
 
     def stop(self) -> timeslot:
-        if not os.path.exists(self.pathCurrent):
-            raise JaktNotActiveError
-
-        # Update status from file
-        self.status()
-
-        #  Create object to add
-        ts = timeslot(
-            ID=self.generateUniqueID(),
-            start=self.activeTimeslot["start"],
-            end=round(time()),
-            project=self.activeTimeslot["project"],
-            tags=self.activeTimeslot["tags"],
-        )
-
-        # Add object to timeslots
-        ts_added = self.add(ts)
-
-        # Removes timeslot data in current timeslot
-        os.remove(self.pathCurrent)
+        with self.lock():
+            # Update status from file
+            self.status()
+
+            # Keep the ID given at start unless it has been taken since
+            ID = self.activeTimeslot["id"]
+            old = self.storage.get(ID)
+            if old is not None:
+                if (old.start, old.project) == (
+                    self.activeTimeslot["start"],
+                    self.activeTimeslot["project"],
+                ):
+                    # Added by a stop that was interrupted before it finished
+                    os.remove(self.pathCurrent)
+                    return old
+
+                ID = self.generateUniqueID()
+
+            #  Create object to add
+            ts = timeslot(
+                ID=ID,
+                start=self.activeTimeslot["start"],
+                end=round(time()),
+                project=self.activeTimeslot["project"],
+                tags=self.activeTimeslot["tags"],
+            )
+
+            # Add object to timeslots, overlaps are reported by overlaps()
+            ts_added = self.add(ts, allowOverlap=True)
+
+            # Removes timeslot data in current timeslot
+            os.remove(self.pathCurrent)
 
         return ts_added
 
     def status(self) -> dict:
-        if not os.path.exists(self.pathCurrent):
+        try:
+            with open(self.pathCurrent, "r") as f:
+                status = json.load(f)
+        except FileNotFoundError:
             raise JaktNotActiveError
-
-        with open(self.pathCurrent, "r") as f:
-            status = json.load(f)
-            f.close()
+        except ValueError:
+            raise JaktCorruptError(self.pathCurrent)
 
         elapsedTime = datetime.fromtimestamp(round(time())) - datetime.fromtimestamp(
             status["start"]
@@ -149,24 +265,52 @@ class jakt:
 
         return status
 
-    def add(self, ts: timeslot) -> timeslot:
+    def watchStatus(self, interval: float = 1.0):
         """
-        Adds new timeslot from.
-        TODO: Implement add for known data.
+        Yields the status, or None if no timer runs, now and whenever it changes.
+
+        While a timer runs the status is also given when the elapsed minutes
+        go up. current.json is watched with inotify where available and
+        polled every interval seconds elsewhere.
         """
+        from .watch import watcher
 
-        # Find all logged timeslots
-        timeslots = self.getTimeslots()
+        watch = watcher(self.pathCurrent, interval)
+        try:
+            while True:
+                try:
+                    status = self.status()
+                except JaktNotActiveError:
+                    status = None
+
+                yield status
 
-        # Append new timeslot to list
-        timeslots.append(ts)
+                if status is None:
+                    timeout = 3600
+                else:
+                    # elapsedMin goes up when the seconds pass 30
+                    timeout = (31 - status["elapsed"] % 60) % 60 or 60
 
-        # Write all timeslots, including newly added to file
-        self.putTimeslots(timeslots)
+                watch.wait(timeout)
+        finally:
+            watch.close()
+
+    def add(self, ts: timeslot, allowOverlap: bool = False) -> timeslot:
+        """
+        Adds new timeslot.
+
+        Raises JaktOverlapError if it overlaps a stored timeslot, unless allowOverlap is set.
+        """
+        with self.lock():
+            if not allowOverlap:
+                self.checkOverlap([ts])
+
+            # Appends a single record, the history is left untouched
+            self.change(lambda: self.storage.append(ts), added=[ts])
 
         return ts
 
-    def editTimeslot(self, queryId:str = None, ts:timeslot = None):
+    def editTimeslot(self, queryId:str = None, ts:timeslot = None, allowOverlap: bool = False):
         """
         Replaces timeslot matching queryId with the modified timeslot ts
         """
@@ -176,25 +320,97 @@ class jakt:
         if ts is None:
             raise JaktError("Updated timeslot must be set.")
 
-        timeslots = self.getTimeslots()
+        return self.editTimeslots({queryId: ts}, allowOverlap=allowOverlap)[0]
 
-        # Update all timeslots
+    def editTimeslots(self, changes: dict, allowOverlap: bool = False) -> list[timeslot]:
+        """
+        Replaces the timeslot of every ID in changes with the timeslot it maps to.
 
-        # Replace timeslot with id=ID with ts
-        for i in range(len(timeslots)):
-            if timeslots[i].id == queryId:
-                timeslots[i] = ts
+        All IDs are checked before anything is written, so an unknown ID
+        changes nothing. Raises JaktOverlapError if a changed timeslot
+        overlaps another one, unless allowOverlap is set.
+        """
+        with self.lock():
+            old = []
+            for queryId in changes:
+                ts = self.storage.get(queryId)
+                if ts is None:
+                    raise JaktInputError(f"No timeslot with ID {queryId}.")
+                old.append(ts)
+
+            if not allowOverlap:
+                # Only timeslots whose start or end changes can overlap anew
+                moved = {
+                    queryId: before
+                    for queryId, before in zip(changes, old)
+                    if (changes[queryId].start, changes[queryId].end) != (before.start, before.end)
+                }
+                self.checkOverlap(
+                    [changes[queryId] for queryId in moved],
+                    exclude=set(moved),
+                    previous={changes[queryId].id: before for queryId, before in moved.items()},
+                )
 
-        self.putTimeslots(timeslots)
+            self.change(
+                lambda: self.storage.replaceMany(list(changes.items())),
+                added=list(changes.values()),
+                removed=old,
+            )
 
-        return ts
+        return list(changes.values())
 
-    def report(self) -> JaktReport:
+    def removeTimeslot(self, queryId: str = None) -> None:
+        """
+        Removes timeslot matching queryId
+        """
+        if queryId is None:
+            raise JaktError("ID must be set.")
+
+        with self.lock():
+            old = self.storage.get(queryId)
+            if old is None:
+                raise JaktInputError(f"No timeslot with ID {queryId}.")
+
+            self.change(lambda: self.storage.remove(queryId), removed=[old])
+
+    def compact(self) -> int:
+        """
+        Folds the journal of changes into the timeslot snapshot.
+        For SQLite storage the database is vacuumed instead.
+
+        Returns the number of folded changes.
+        """
+        with self.lock():
+            return self.storage.compact()
+
+    def report(self, from_=False, to=False) -> JaktReport:
         """
         Returns a JaktReport object
+
+        If from_ or to is given only timeslots starting in [from_, to) are included.
+        """
+
+        with self.lock(shared=True):
+            return JaktReport(self, from_=from_, to=to)
+
+    def periodReport(self, by: str = "week", from_=False, to=False) -> PeriodReport:
+        """
+        Returns a PeriodReport with totals per day, week or month
+
+        If from_ or to is given only days in [from_, to) are included.
+        """
+
+        with self.lock(shared=True):
+            return PeriodReport(self, by=by, from_=from_, to=to)
+
+    def heatmap(self, from_=False, to=False, project=False, tag=False) -> Heatmap:
         """
+        Returns a Heatmap of tracked time by weekday and hour of day
 
-        return JaktReport(self)
+        If from_ or to is given only timeslots starting in [from_, to) are included.
+        """
+        with self.lock(shared=True):
+            return Heatmap(self, from_=from_, to=to, project=project, tag=tag)
 
     def resume(self) -> timeslot:
     	"""
@@ -210,25 +426,220 @@ class jakt:
 
     	return response
 
+    ## Bulk changes
+    def bulkEdit(
+        self, edit, from_=False, to=False, project=False, tag=False, dryRun=False
+    ) -> int:
+        """
+        Calls edit on every timeslot matching the filters, like getTimeslots.
+
+        edit returns the changed timeslot, or None to leave it as it is. All
+        changes are written together, like with editTimeslots. With dryRun nothing
+        is written.
+
+        Returns the number of changed timeslots.
+        """
+        with self.lock():
+            changes = {}
+            old = []
+            for ts in self.storage.iterate(from_=from_, to=to, project=project, tag=tag):
+                new = edit(ts)
+                if new is not None and new.toDict() != ts.toDict():
+                    changes[ts.id] = new
+                    old.append(ts)
+
+            if changes and not dryRun:
+                self.change(
+                    lambda: self.storage.replaceMany(list(changes.items())),
+                    added=list(changes.values()),
+                    removed=old,
+                )
+
+        return len(changes)
+
+    def moveTimeslots(self, newProject: str, **filters) -> int:
+        """
+        Moves the timeslots matching filters to newProject
+        """
+        return self.bulkEdit(
+            lambda ts: timeslot(ts.id, ts.start, ts.end, newProject, ts.tags),
+            **filters,
+        )
+
+    def renameProject(self, oldProject: str, newProject: str, **filters) -> int:
+        """
+        Renames oldProject to newProject, merging them if newProject exists
+        """
+        return self.moveTimeslots(newProject, project=oldProject, **filters)
+
+    def renameTag(self, oldTag: str, newTag: str, **filters) -> int:
+        """
+        Renames oldTag to newTag, merging them where a timeslot has both
+        """
+
+        def edit(ts):
+            tags = [newTag if t == oldTag else t for t in ts.tags]
+            return timeslot(ts.id, ts.start, ts.end, ts.project, list(dict.fromkeys(tags)))
+
+        return self.bulkEdit(edit, tag=oldTag, **filters)
+
+    def addTags(self, tags: list[str], **filters) -> int:
+        """
+        Adds tags to the timeslots matching filters that do not have them yet
+        """
+        return self.bulkEdit(
+            lambda ts: timeslot(
+                ts.id, ts.start, ts.end, ts.project, list(dict.fromkeys(ts.tags + list(tags)))
+            ),
+            **filters,
+        )
+
+    def removeTags(self, tags: list[str], **filters) -> int:
+        """
+        Removes tags from the timeslots matching filters
+        """
+        return self.bulkEdit(
+            lambda ts: timeslot(
+                ts.id, ts.start, ts.end, ts.project, [t for t in ts.tags if t not in tags]
+            ),
+            **filters,
+        )
+
+
+    ## Overlaps
+    def overlaps(self, start: int, end: int, exclude=()) -> list[timeslot]:
+        """
+        Returns the stored timeslots overlapping [start, end), except those with IDs in exclude
+
+        Only timeslots starting within the longest stored timeslot before
+        start are read, so the check does not depend on the size of the history.
+        """
+        with self.lock(shared=True):
+            window = self.storage.table(from_=start - self.intervals.longest, to=end)
+
+        return [
+            ts for ts in IntervalIndex(window).overlapping(start, end) if ts.id not in exclude
+        ]
+
+    def checkOverlap(self, timeslots: list[timeslot], exclude=(), previous=None) -> None:
+        """
+        Raises JaktOverlapError if timeslots overlap each other or stored timeslots
+
+        previous maps the ID of an edited timeslot to its version before the
+        edit, overlaps those versions already had are not raised again.
+        """
+        timeslots = [ts for ts in timeslots if ts.end is not None]
+        previous = previous or {}
+
+        def overlapped(first, second) -> bool:
+            first = previous.get(first.id, first)
+            second = previous.get(second.id, second)
+            if first.end is None or second.end is None:
+                return False
+            return first.start < second.end and second.start < first.end
+
+        exclude = set(exclude) | {ts.id for ts in timeslots}
+        for ts in timeslots:
+            for other in self.overlaps(ts.start, ts.end, exclude=exclude):
+                if not overlapped(ts, other):
+                    raise JaktOverlapError(f"{ts.id} overlaps {other.id}.")
+
+        overlaps, _ = IntervalIndex(TimeslotTable.fromTimeslots(timeslots)).sweep()
+        for first, second, _ in overlaps:
+            if not overlapped(first, second):
+                raise JaktOverlapError(f"{second.id} overlaps {first.id}.")
+
+    def at(self, moment) -> list[timeslot]:
+        """
+        Returns the timeslots running at moment, a datetime or timestamp, including the active one
+        """
+        if isinstance(moment, datetime):
+            moment = int(moment.timestamp())
+
+        found = self.overlaps(moment, moment + 1)
+
+        try:
+            current = self.status()
+            if current["start"] <= moment:
+                found.append(
+                    timeslot(current["id"], current["start"], None, current["project"], current["tags"])
+                )
+        except JaktNotActiveError:
+            pass
+
+        return found
+
+    def checkOverlaps(self) -> dict:
+        """
+        Finds every overlap and gap between stored timeslots in one sweep.
+
+        Returns {"overlaps": [(first, second, seconds)], "gaps": [(end, start)]}
+        """
+        with self.lock(shared=True):
+            table = self.storage.table()
+
+        overlaps, gaps = IntervalIndex(table).sweep()
+
+        return {"overlaps": overlaps, "gaps": gaps}
 
     ## Get and put data
     def getConfig(self) -> dict:
         return self.config
 
     def putConfig(self, config : dict = None) -> None:
+        import yaml
+
         if not config:
             config = self.getConfig()
 
-        with open(self.pathConfig, "w") as f:
-            yaml.dump(config, f, default_flow_style=True)
+        atomicWrite(self.pathConfig, yaml.dump(config, default_flow_style=True))
+
+        self.cacheConfig(config)
 
         return
 
+    def readConfig(self) -> dict:
+        """
+        Returns the parsed config.
+
+        Parsing YAML is slow, so the parsed config is cached as JSON and only
+        parsed again when config.yml changes.
+        """
+        st = os.stat(self.pathConfig)
+
+        try:
+            with open(self.pathConfigCache, "r") as f:
+                cached = json.load(f)
+            if cached["stat"] == [st.st_mtime_ns, st.st_size]:
+                return cached["config"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        import yaml
+
+        with open(self.pathConfig, "r") as f:
+            config = yaml.safe_load(f)
+
+        self.cacheConfig(config)
+
+        return config
+
+    def cacheConfig(self, config: dict) -> None:
+        try:
+            st = os.stat(self.pathConfig)
+            cached = {"stat": [st.st_mtime_ns, st.st_size], "config": config}
+            atomicWrite(self.pathConfigCache, json.dumps(cached))
+        except (OSError, JaktPathError, TypeError, ValueError):
+            # Config is still read from config.yml
+            pass
+
 
     def getCategories(self) -> list[str]:
         """
         Returns a list of all defined categories
         """
+        import yaml
+
         try:
             with open(self.pathCategories, "r") as f:
                 categories = yaml.safe_load(f)
@@ -241,106 +652,76 @@ class jakt:
         except OSError:
             raise JaktPathError(self.pathCategories)
 
-    def getProjects(self) -> list[str]:
+    def getProjects(self, sort: str = None) -> list[str]:
         """
         Returns list of all projects
-        """
-        timeslots = self.getTimeslots()
 
-        projects = []
-        for i in range(len(timeslots)):
-            if timeslots[i].project not in projects:
-                projects.append(timeslots[i].project)
-
-        return projects
+        sort can be "recency" or "frequency", see Catalog.projects.
+        """
+        with self.lock(shared=True):
+            return self.catalog.projects(sort=sort)
 
-    def getTags(self, project: str = None) -> list[str]:
+    def getTags(self, project: str = None, sort: str = None) -> list[str]:
         """
         Returns a list of all used tags.
 
         If project is given only tags for the matching project are given.
+        sort can be "recency" or "frequency", see Catalog.projects.
         """
-        timeslots = self.getTimeslots()
-
-        tags = []
-        for i in range(len(timeslots)):
-            if project and not (project == timeslots[i].project):
-                continue
-
-            currentTags = timeslots[i].tags
-
-            for j in range(len(currentTags)):
-                if currentTags[j] not in tags:
-                    tags.append(currentTags[j])
-
-        return tags
+        with self.lock(shared=True):
+            return self.catalog.tags(project=project, sort=sort)
 
     def getTimeslots(
         self, from_=False, to=False, project=False, tag=False
     ) -> list[timeslot]:
         """
         Returns a list of logged timeslots
+
+        from_ and to can be datetimes or timestamps. If one of them is given
+        only timeslots starting in [from_, to) are returned, sorted by start.
         """
         try:
-       	    try:
-                with open(self.pathTimeslots, "r") as f:
-                    timeslots = json.load(f)
-                    f.close()
-            except json.JSONDecodeError:
-                return[]
-
-            # Create timeslot instances
-            for i in range(len(timeslots)):
-                timeslots[i] = timeslot.from_json(timeslots[i])
-
-            # TODO: Implement filtering with to and from_
-            if to and from_:
-                # Remove timeslots that do not match
-                pass
-
-            # Filters by project if project is given
-            if project:
-                project_filter = []
-                for ts in timeslots:
-                    if ts.project == project:
-                        project_filter.append(ts)
-
-                timeslots = project_filter
-
-            # Filters by tags if tage are given
-            if tag:
-                tag_filter = []
-                for ts in timeslots:
-                    if tag in ts.tags:
-                        tag_filter.append(ts)
-
-                timeslots = tag_filter
-
-            return timeslots
+            with self.lock(shared=True):
+                return self.storage.query(
+                    from_=from_, to=to, project=project, tag=tag
+                )
         except OSError:
             raise JaktPathError(self.pathTimeslots)
 
-    def getTimeslot(self, queryId: str) -> timeslot:
-        timeslots = self.getTimeslots()
+    def iterTimeslots(self, from_=False, to=False, project=False, tag=False):
+        """
+        Yields the timeslots getTimeslots would return without building a list
+        """
+        try:
+            with self.lock(shared=True):
+                yield from self.storage.iterate(
+                    from_=from_, to=to, project=project, tag=tag
+                )
+        except OSError:
+            raise JaktPathError(self.pathTimeslots)
 
-        for ts in timeslots:
-            if ts.id == queryId:
-                return ts
+    def getTable(self, from_=False, to=False) -> TimeslotTable:
+        """
+        Returns completed timeslots as a TimeslotTable, filtered like getTimeslots
+        """
+        try:
+            with self.lock(shared=True):
+                return self.storage.table(from_=from_, to=to)
+        except OSError:
+            raise JaktPathError(self.pathTimeslots)
 
-        return False
+    def getTimeslot(self, queryId: str) -> timeslot:
+        with self.lock(shared=True):
+            ts = self.storage.get(queryId)
 
-    def putTimeslots(self, timeslots: list[timeslot]) -> None:
-        obj_list = []
+        if ts is None:
+            return False
 
-        for ts in timeslots:
-            obj_list.append(ts.toDict())
+        return ts
 
-        try:
-            with open(self.pathTimeslots, "w") as f:
-                json.dump(obj_list, f)
-                f.close()
-        except OSError:
-            raise JaktPathError(self.pathTimeslots)
+    def putTimeslots(self, timeslots: list[timeslot]) -> None:
+        with self.lock():
+            self.storage.write(timeslots)
 
     def getPath(self):
         return self.dataPath
@@ -348,51 +729,82 @@ class jakt:
 
     ## Helper functions
     def generateUniqueID(self) -> str:
-        timeslots = self.getTimeslots()
+        return self.generateUniqueIDs(1)[0]
 
-        usedIDs = []
-        for ts in timeslots:
-            usedIDs.append(ts.id)
+    def generateUniqueIDs(self, n: int, exclude: set = ()) -> list[str]:
+        """
+        Returns n new IDs that are not used by any stored timeslot or in exclude
+        """
+        exclude = set(exclude)
 
-        ID = f"{randrange(16**8):08x}"
-        if ID not in usedIDs:
-            return ID
-        else:
-            return self.generateUniqueID()
+        IDs = set()
+        while len(IDs) < n:
+            candidates = {os.urandom(4).hex() for _ in range(n - len(IDs))}
+            candidates -= exclude | IDs
+            IDs |= candidates - self.storage.used(candidates)
+
+        return list(IDs)
 
     ## Remote syncronization
-    def fetch(self):
-        pass
+    def fetch(self) -> dict:
+        """
+        Downloads the remote changes without merging them, returns the remote manifest
+        """
+        from .sync import Sync
 
-    def pull(self):
-        pass
+        return Sync(self).fetch()
 
-    def push(self):
-        pass
+    def pull(self) -> dict:
+        """
+        Merges the remote changes into the local timeslots, see sync.py
+        """
+        from .sync import Sync
 
-    ## Import / Export
+        return Sync(self).pull()
 
-    def toCSV(self, timeslots):
+    def push(self) -> dict:
         """
-        Returns list of CSV lineitems for all timeslots. 
+        Pulls, then sends the local changes to the remote
         """
+        from .sync import Sync
 
-        csvLines = []
+        return Sync(self).push()
 
-        header = "id,start,end,project,tags"
-        csvLines.append(header)
+    ## Import / Export
+
+    def csvRows(self, timeslots):
+        """
+        Yields the CSV header followed by a row for each timeslot.
+        """
+        yield ["id", "start", "end", "project", "tags"]
 
         for ts in timeslots:
-            csvLines.append(ts.toCSV())
+            yield ts.toRow()
+
+    def toCSV(self, timeslots):
+        """
+        Returns list of CSV lineitems for all timeslots. 
+        """
+        import csv
 
-        return csvLines
+        lines = io.StringIO()
+        csv.writer(lines, lineterminator="\n").writerows(self.csvRows(timeslots))
 
+        return lines.getvalue().splitlines()
 
-    def export(self, path:str = None):
+
+    def export(
+        self, path:str = None, from_=False, to=False, project=False, tag=False
+    ):
         """
-        Exports all timeslot data to a CSV file
+        Exports timeslot data to a CSV file, or to stdout if path is '-'.
+
+        Timeslots are streamed to the file in chunks and can be filtered the
+        same way as in getTimeslots.
         """
-        if path is not None:
+        if path == "-":
+            fullPath = None
+        elif path is not None:
             if path[-4:] != ".csv":
                 raise JaktPathError("Only CSV files are supported for now. Path must end with '.csv'")
 
@@ -403,21 +815,36 @@ class jakt:
         else:
             fullPath = os.path.join(self.dataPath, "export.csv")
 
-        timeslots = self.getTimeslots()
+        timeslots = self.iterTimeslots(from_=from_, to=to, project=project, tag=tag)
+        rows = self.csvRows(timeslots)
 
-        csvItems = self.toCSV(timeslots)
+        if fullPath is None:
+            self.writeCSV(sys.stdout, rows)
+            return
 
-        with open(fullPath, "w") as f:
-            for item in csvItems:
-                f.write(f"{item}\n")
-            f.close()
+        try:
+            with open(fullPath, "w", newline="") as f:
+                self.writeCSV(f, rows)
+        except OSError:
+            raise JaktPathError(fullPath)
 
         return
 
+    def writeCSV(self, f, rows, chunk: int = 1000) -> None:
+        import csv
+
+        writer = csv.writer(f, lineterminator="\n")
+
+        while True:
+            batch = list(islice(rows, chunk))
+            if not batch:
+                break
+            writer.writerows(batch)
 
-    def importInternal(self, path:str = None, sep=","):
+
+    def importPath(self, path: str = None) -> str:
         """
-        Imports timeslots from file generated by jakt.
+        Validates path of a file to import and returns the full path
         """
         if path is None:
             raise JaktPathError("No file given.")
@@ -427,107 +854,217 @@ class jakt:
 
         if path[0] == "/":
             raise JaktPathError("Absolute paths are not supported.")
-        else:
-            fullPath = os.path.join(os.getcwd(), path)
 
-        with open(fullPath, "r") as f:
-            data = f.readlines()
-            f.close()
-        
-        # Initial filtering
-        rawTimeslots = []
-        for line in data:
-            rawTimeslots.append(line.strip("\n").split(sep))
-
-        # Remove header
-        rawTimeslots.pop(0)
-
-        timeslots = []
-        for ts in rawTimeslots:
-            # Id
-            ID = ts[0]
-
-            # Timestamps
-            start = int(ts[1])
-            end = int(ts[2])
-
-            # Project
-            project = ts[3]
-
-            # Tag
-            tags = ts[4:len(ts)]
-            for i in range(len(tags)):
-                tags[i] = tags[i].replace("[","").replace("]","").replace("'","").replace(" ","")
-            
-            # Create timeslot
-            new_ts = timeslot(
-                    ID = ID,
+        fullPath = os.path.join(os.getcwd(), path)
+        if not os.path.exists(fullPath):
+            raise JaktPathError(f"{path} does not exist.")
+
+        return fullPath
+
+    def importInternal(self, path:str = None, sep=",", progress=None) -> dict:
+        """
+        Imports timeslots from file generated by jakt.
+
+        Imported timeslots are added to the existing ones, see importTimeslots.
+        """
+        import csv
+
+        fullPath = self.importPath(path)
+
+        with open(fullPath, "r", newline="") as f:
+            rows = csv.reader(f, delimiter=sep)
+
+            # Remove header
+            next(rows, None)
+
+            return self.importTimeslots(self.parseInternal(rows), progress=progress)
+
+    def parseInternal(self, rows):
+        """
+        Yields a timeslot, or None if the row is invalid, for every row of a jakt export
+        """
+        for ts in rows:
+            if not ts:
+                continue
+
+            try:
+                # Tags are ';'-separated, older exports wrote a list over several columns
+                tags = ts[4:len(ts)]
+                if len(tags) == 1 and not tags[0].startswith("["):
+                    tags = splitTags(tags[0])
+                else:
+                    for i in range(len(tags)):
+                        tags[i] = tags[i].replace("[","").replace("]","").replace("'","").replace(" ","")
+                    tags = [tag for tag in tags if tag]
+
+                yield timeslot(
+                    ID = ts[0],
+                    start = int(ts[1]),
+                    end = int(ts[2]),
+                    project = ts[3],
+                    tags = tags,
+                )
+            except (IndexError, ValueError):
+                yield None
+
+    def importTT(
+        self, path:str = None, _format:str = None, sep:str = "\t", progress=None
+    ) -> dict:
+        """
+        Imports timeslots from file generated by other timetrakcing software.
+
+        Imported timeslots are added to the existing ones, see importTimeslots.
+        """
+        import csv
+
+        fullPath = self.importPath(path)
+
+        with open(fullPath, "r", newline="") as f:
+            rows = csv.reader(f, delimiter=sep)
+
+            # Remove header
+            next(rows, None)
+
+            return self.importTimeslots(self.parseTT(rows), progress=progress)
+
+    def parseTT(self, rows):
+        """
+        Yields a timeslot without ID, or None if the row is invalid, for every
+        row of a Timetracker export
+        """
+        for ts in rows:
+            # Skip empty rows
+            if not ts or ts[0] == "":
+                continue
+
+            try:
+                # Timestamps
+                start = int(ts[1])
+                end = int(ts[2])
+
+                # Project and tags
+                if len(ts[3]) == 0:
+                    project = "default"
+                    tags = ["<no tags>"]
+                else:
+                    TT_tags = ts[3].replace("#", "").split(" ")
+                    project = TT_tags[0]
+                    tags = TT_tags[1:]
+
+                yield timeslot(
+                    ID = None,
                     start = start,
                     end = end,
                     project = project,
                     tags = tags,
                 )
+            except (IndexError, ValueError):
+                yield None
 
-            timeslots.append(new_ts)
+    def importTimeslots(self, timeslots, progress=None) -> dict:
+        """
+        Adds timeslots that are not already logged in a single write.
 
-        # Put timeslots
-        self.putTimeslots(timeslots)
+        A timeslot is skipped if its ID or its start, end, project and tags
+        match a logged or previously imported timeslot. Timeslots without an
+        ID get a new one. Invalid timeslots are given as None and counted.
 
+        progress is called with the number of rows read every 10000 rows.
 
-    def importTT(self, path:str = None, _format:str = None, sep:str = "\t"):
-        """
-        Imports timeslots from file generated by other timetrakcing software.
+        Returns the number of added, skipped and invalid rows.
         """
-        if path is None:
-            raise JaktPathError("No file given.")
+        with self.lock():
+            def content(ts):
+                return (ts.start, ts.end, ts.project, tuple(ts.tags))
 
-        if path[-4:] != ".csv":
-            raise JaktPathError("Only CSV files are supported for now. Path must end with '.csv'")
+            seen = set(content(ts) for ts in self.iterTimeslots())
+            seenIDs = set()
 
-        if path[0] == "/":
-            raise JaktPathError("Absolute paths are not supported.")
-        else:
-            fullPath = os.path.join(os.getcwd(), path)
+            counts = {"added": 0, "skipped": 0, "invalid": 0}
+            new = []
 
-        with open(fullPath, "r") as f:
-            data = f.readlines()
-            f.close()
+            for i, ts in enumerate(timeslots, 1):
+                if progress and i % 10000 == 0:
+                    progress(i)
 
-        rawTimeslots = []
-        for line in data:
-            rawTimeslots.append(line.strip("\n").split(sep))
+                if ts is None or ts.end < ts.start or not ts.project:
+                    counts["invalid"] += 1
+                    continue
 
-        header = rawTimeslots.pop(0)
+                key = content(ts)
+                if key in seen or ts.id in seenIDs:
+                    counts["skipped"] += 1
+                    continue
 
-        timeslots = []
+                seen.add(key)
+                if ts.id is not None:
+                    seenIDs.add(ts.id)
+                new.append(ts)
 
+            # IDs already logged, checked in one batch
+            taken = self.storage.used(seenIDs)
+            if taken:
+                counts["skipped"] += sum(1 for ts in new if ts.id in taken)
+                new = [ts for ts in new if ts.id not in taken]
 
-        for ts in rawTimeslots:
+            # Give new IDs to timeslots that do not have one
+            missing = [ts for ts in new if ts.id is None]
+            IDs = self.generateUniqueIDs(len(missing), exclude=seenIDs)
+            for ts, ID in zip(missing, IDs):
+                ts.id = ID
 
-            if ts[0] == "":
-                continue
+            self.change(lambda: self.storage.extend(new), added=new)
+            counts["added"] = len(new)
 
-            # Timestamps
-            start = int(ts[1])
-            end = int(ts[2])
+        return counts
 
-            # Project and tags
-            if len(ts[3]) == 0:
-                project = "default"
-                tags = ["<no tags>"]
-            else:
-                TT_tags = ts[3].replace("#", "").split(" ")
-                project = TT_tags[0]
-                tags = TT_tags[1:]
+    def merge(self, path: str, policy: str = "ours", dryRun: bool = False) -> dict:
+        """
+        Merges the timeslots of the data directory at path into these, see merge.py.
 
-            new_ts = timeslot(
-                    ID = self.generateUniqueID(),
-                    start = start,
-                    end = end,
-                    project = project,
-                    tags = tags,
-                )
+        Conflicts are resolved by policy, "ours", "theirs" or "both". The
+        merged timeslots are written in a single write, with dryRun nothing is
+        written. A timeslot running in the other directory is left out.
+
+        Returns the number of added, replaced and skipped timeslots and of conflicts.
+        """
+        from .merge import POLICIES, mergeJoin
+
+        if policy not in POLICIES:
+            raise JaktInputError(f"Unknown policy '{policy}'.")
+
+        # jakt() would set up a new data directory on a mistyped path
+        if not os.path.isfile(os.path.join(path, "config.yml")):
+            raise JaktPathError(path)
+
+        other = jakt(path)
+        if os.path.realpath(other.dataPath) == os.path.realpath(self.dataPath):
+            raise JaktInputError("Can not merge a data directory with itself.")
+
+        # Read before taking our lock, two merges in opposite directions
+        # would wait on each other otherwise
+        with other.lock(shared=True):
+            theirs = list(other.storage.ordered())
+
+        with self.lock():
+            ours = list(self.storage.ordered())
+            merged, counts = mergeJoin(ours, theirs, policy=policy)
+
+            if dryRun or not (counts["added"] or counts["replaced"]):
+                return counts
+
+            # Timeslots kept next to a conflicting one get a new ID
+            renamed = [ts for ts in merged if ts.id is None]
+            IDs = self.generateUniqueIDs(
+                len(renamed), exclude={ts.id for ts in merged if ts.id is not None}
+            )
+            for ts, ID in zip(renamed, IDs):
+                ts.id = ID
+
+            old = {ts.id: ts for ts in ours}
+            added = [ts for ts in merged if old.get(ts.id) is not ts]
+            removed = [old[ts.id] for ts in added if ts.id in old]
 
-            timeslots.append(new_ts)
+            self.change(lambda: self.storage.write(merged), added=added, removed=removed)
 
-        self.putTimeslots(timeslots)
+        return counts
@@ -0,0 +1,233 @@
+"""
+Time of day and weekday analytics over the columns of a TimeslotTable.
+
+Sessions are split at local hour boundaries with integer arithmetic on
+the start and end columns, so no datetime is built per record. NumPy is
+used when it is installed, otherwise the same split runs over arrays in
+plain Python.
+"""
+from time import localtime
+from array import array
+from datetime import date, datetime, timedelta
+
+from .timeslot import TimeslotTable
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# 1970-01-01 was a Thursday, weekday() 3
+EPOCH_WEEKDAY = 3
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def numpy():
+    """
+    Returns the numpy module, or None if it is not installed
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+
+    return numpy
+
+
+def utcOffset(timestamp: int) -> int:
+    """
+    Returns the local UTC offset in seconds at timestamp
+    """
+    return localtime(timestamp).tm_gmtoff
+
+
+def dayOffset(day: int):
+    """
+    Returns the UTC offset during the UTC day since the epoch, or None if it changes that day
+    """
+    offset = utcOffset(day * DAY)
+    if utcOffset(day * DAY + DAY - 1) != offset:
+        return None
+
+    return offset
+
+
+def toDatetime(value) -> datetime:
+    """
+    Returns a datetime for a datetime, date or timestamp
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+
+    return datetime.fromtimestamp(value)
+
+
+def filterTable(table: TimeslotTable, project=False, tag=False) -> TimeslotTable:
+    """
+    Returns the rows of table with project and tag, if given
+    """
+    if not (project or tag):
+        return table
+
+    filtered = TimeslotTable()
+    for i, (proj, tags) in enumerate(zip(table.projects, table.tags)):
+        if project and proj != project:
+            continue
+        if tag and tag not in tags:
+            continue
+
+        filtered.ids.append(table.ids[i])
+        filtered.starts.append(table.starts[i])
+        filtered.ends.append(table.ends[i])
+        filtered.projects.append(proj)
+        filtered.tags.append(tags)
+
+    return filtered
+
+
+def splitHours(starts, ends):
+    """
+    Splits sessions at hour boundaries of local time.
+
+    Returns (hours, seconds), the local hour since the epoch each piece
+    falls in and its length. The UTC offset is looked up once per day,
+    and per session only on days it changes. A session uses the offset at
+    its start throughout.
+    """
+    np = numpy()
+    if np is not None:
+        return splitHoursNumpy(np, starts, ends)
+
+    offsets = {}
+    hours = array("q")
+    seconds = array("q")
+    for start, end in zip(starts, ends):
+        day = start // DAY
+        if day not in offsets:
+            offsets[day] = dayOffset(day)
+
+        offset = offsets[day]
+        if offset is None:
+            offset = utcOffset(start)
+
+        start += offset
+        end += offset
+        for hour in range(start // HOUR, (end - 1) // HOUR + 1):
+            hours.append(hour)
+            seconds.append(min(end, (hour + 1) * HOUR) - max(start, hour * HOUR))
+
+    return hours, seconds
+
+
+def splitHoursNumpy(np, starts, ends):
+    starts = np.frombuffer(starts, dtype=np.int64)
+    ends = np.frombuffer(ends, dtype=np.int64)
+
+    # One offset lookup per distinct day
+    days, inverse = np.unique(starts // DAY, return_inverse=True)
+    offsets = [dayOffset(int(day)) for day in days]
+    changing = [i for i, offset in enumerate(offsets) if offset is None]
+
+    offsets = np.array([offset or 0 for offset in offsets], dtype=np.int64)[inverse]
+    if changing:
+        rows = np.flatnonzero(np.isin(inverse, changing))
+        offsets[rows] = [utcOffset(int(start)) for start in starts[rows]]
+
+    starts = starts + offsets
+    ends = ends + offsets
+
+    keep = ends > starts
+    starts = starts[keep]
+    ends = ends[keep]
+
+    first = starts // HOUR
+    counts = (ends - 1) // HOUR - first + 1
+
+    # Row and position within the row of every piece
+    rows = np.repeat(np.arange(len(starts)), counts)
+    steps = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    hours = first[rows] + steps
+    seconds = np.minimum(ends[rows], (hours + 1) * HOUR) - np.maximum(
+        starts[rows], hours * HOUR
+    )
+
+    return hours, seconds
+
+
+class Heatmap:
+    """
+    Tracked time by weekday and hour of day, hour utilisation and daily totals.
+
+    data holds
+        "weekdays": seconds for each weekday (Monday first) and hour of day
+        "hours": share of every hour of day that was tracked, 0 to 1
+        "days": seconds per day, by ISO date
+        "first", "last": the days covered, as ISO dates
+    """
+
+    def __init__(self, jkt, from_=False, to=False, project=False, tag=False):
+        table = filterTable(jkt.getTable(from_=from_, to=to), project, tag)
+
+        starts = table.starts
+        ends = table.ends
+        if to:
+            # Time after the period is left out
+            limit = int(toDatetime(to).timestamp())
+            ends = array("q", [min(end, limit) for end in ends])
+
+        hours, seconds = splitHours(starts, ends)
+
+        np = numpy()
+        if np is not None:
+            localDays = hours // 24
+            cells = np.bincount(
+                ((localDays + EPOCH_WEEKDAY) % 7) * 24 + hours % 24,
+                weights=seconds,
+                minlength=7 * 24,
+            )
+            weekdays = [[int(s) for s in cells[d * 24 : d * 24 + 24]] for d in range(7)]
+
+            perDay = {}
+            if len(localDays):
+                lo = int(localDays.min())
+                totals = np.bincount(localDays - lo, weights=seconds)
+                for i in np.flatnonzero(totals):
+                    perDay[lo + int(i)] = int(totals[i])
+        else:
+            weekdays = [[0] * 24 for _ in range(7)]
+            perDay = {}
+            for hour, secs in zip(hours, seconds):
+                localDay = hour // 24
+                weekdays[(localDay + EPOCH_WEEKDAY) % 7][hour % 24] += secs
+                perDay[localDay] = perDay.get(localDay, 0) + secs
+
+        epoch = date(1970, 1, 1)
+        days = {(epoch + timedelta(days=d)).isoformat(): s for d, s in sorted(perDay.items())}
+
+        first = last = None
+        if from_:
+            first = toDatetime(from_).date()
+        elif days:
+            first = date.fromisoformat(min(days))
+        if to:
+            # to is exclusive, like in PeriodReport
+            last = (toDatetime(to) - timedelta(seconds=1)).date()
+        elif days:
+            last = date.fromisoformat(max(days))
+
+        hourTotals = [sum(weekdays[d][h] for d in range(7)) for h in range(24)]
+        span = (last - first).days + 1 if first and last else 0
+        utilisation = [t / (span * HOUR) if span > 0 else 0 for t in hourTotals]
+
+        self.data = {
+            "weekdays": weekdays,
+            "hours": utilisation,
+            "days": days,
+            "first": first.isoformat() if first else None,
+            "last": last.isoformat() if last else None,
+        }
+
+    def __str__(self):
+        return f"{self.data}"
@@ -0,0 +1,183 @@
+import os
+from contextlib import contextmanager
+
+from .exceptions import *
+
+
+def atomicWrite(path: str, data, sync: bool = True) -> None:
+    """
+    Replaces the contents of path with data, a str or bytes.
+
+    data is written to a temporary file next to path, flushed to disk and
+    renamed over path, so readers see either the old or the new contents.
+    With sync=False, for caches, nothing waits for the disk.
+    """
+    directory = os.path.dirname(path) or "."
+    tmp = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+
+    try:
+        with open(tmp, "wb" if isinstance(data, bytes) else "w") as f:
+            f.write(data)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+
+        os.replace(tmp, path)
+        if sync:
+            syncDirectory(directory)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise JaktPathError(path)
+
+
+def atomicCreate(path: str, data: str) -> bool:
+    """
+    Creates path holding data unless it already exists.
+
+    Returns False if path exists. The file is written in full before it
+    appears, like in atomicWrite, and is linked in place so creating it
+    fails if another process created it first.
+    """
+    directory = os.path.dirname(path) or "."
+    tmp = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+
+    try:
+        with open(tmp, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            return False
+
+        syncDirectory(directory)
+        return True
+    except OSError:
+        raise JaktPathError(path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def appendLines(path: str, data: str) -> None:
+    """
+    Appends data, one or more complete lines, to path and flushes it to disk.
+
+    A partial last line left by an interrupted append is cut off first, so
+    it does not run into the new lines.
+    """
+    try:
+        with open(path, "ab+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    f.truncate(lastNewline(f, size))
+
+            f.write(data.encode())
+            f.flush()
+            os.fsync(f.fileno())
+    except OSError:
+        raise JaktPathError(path)
+
+
+def lastNewline(f, size: int, block: int = 4096) -> int:
+    """
+    Returns the position just after the last newline in f, or 0 if there is none
+    """
+    end = size
+    while end > 0:
+        start = max(0, end - block)
+        f.seek(start)
+        i = f.read(end - start).rfind(b"\n")
+        if i >= 0:
+            return start + i + 1
+        end = start
+
+    return 0
+
+
+def syncDirectory(directory: str) -> None:
+    """
+    Flushes a rename in directory to disk, where the platform allows it
+    """
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class FileLock:
+    """
+    Advisory lock shared by all jakt processes using the same data directory.
+
+    Readers take the lock shared and never block each other, writers take
+    it exclusive. The lock can be taken again while it is held, an
+    exclusive request inside a shared one upgrades it until it is left.
+    Holders do not need to leave in order, so generators may hold it.
+    Without fcntl, on Windows, locking does nothing.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.fd = None
+        self.mode = None
+        self.holders = {"shared": 0, "exclusive": 0}
+
+    @contextmanager
+    def __call__(self, shared: bool = False):
+        kind = "shared" if shared else "exclusive"
+
+        self.holders[kind] += 1
+        try:
+            self.update()
+            yield
+        finally:
+            self.holders[kind] -= 1
+            self.update()
+
+    def update(self) -> None:
+        """
+        Takes, converts or releases the lock to match its holders
+        """
+        mode = None
+        if self.holders["exclusive"]:
+            mode = "exclusive"
+        elif self.holders["shared"]:
+            mode = "shared"
+
+        if mode != self.mode:
+            self.acquire(mode)
+            self.mode = mode
+
+    def acquire(self, mode: str) -> None:
+        """
+        Takes the lock as mode, or releases it if mode is None
+        """
+        try:
+            import fcntl
+        except ImportError:
+            return
+
+        if self.fd is None:
+            try:
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError:
+                raise JaktPathError(self.path)
+
+        operation = {
+            "shared": fcntl.LOCK_SH,
+            "exclusive": fcntl.LOCK_EX,
+            None: fcntl.LOCK_UN,
+        }[mode]
+        fcntl.flock(self.fd, operation)
@@ -0,0 +1,443 @@
+"""
+Benchmarks for jakt.
+
+Generates synthetic histories in a temporary directory and times common
+commands through the library and through the click CLI. Run with
+
+    python -m jakt.bench --sizes 1000,10000 --output results.json
+
+Results are written as JSON. Given --compare with an earlier result file,
+operations that got slower than --threshold times are reported as
+regressions and the exit code is 1. The same goes for CLI startup time
+exceeding --startup-budget.
+
+--stress runs that many processes starting, stopping and adding timeslots
+on the same data at once and checks that nothing was lost or corrupted.
+"""
+import os
+import sys
+import json
+import random
+import platform
+import tempfile
+import statistics
+import subprocess
+import multiprocessing
+from time import time, perf_counter
+from datetime import datetime, timedelta
+
+import click
+from click.testing import CliRunner
+
+from . import jakt
+from .cli import cli
+from .timeslot import timeslot
+from .exceptions import *
+
+
+def version() -> str:
+    try:
+        from importlib.metadata import version as packageVersion
+
+        return packageVersion("jakt")
+    except Exception:
+        return "unknown"
+
+
+def generate(path: str, size: int, storage: str = "json", seed: int = 0) -> jakt:
+    """
+    Creates a data directory at path holding size synthetic timeslots.
+
+    Projects and tags follow a skewed spread, a few are used a lot and
+    most are used rarely. Timeslots are laid out back to back going
+    backwards from now, 15 minutes to 3 hours each.
+    """
+    rng = random.Random(seed)
+
+    jkt = jakt(path)
+    config = jkt.getConfig()
+    config["storage"] = storage
+    jkt.putConfig(config)
+    jkt = jakt(path)
+
+    projects = [f"project{i}" for i in range(max(3, min(50, size // 500)))]
+    projectWeights = [1 / (i + 1) for i in range(len(projects))]
+    tags = {p: [f"{p}-tag{j}" for j in range(8)] for p in projects}
+
+    IDs = jkt.generateUniqueIDs(size)
+
+    timeslots = []
+    end = round(time()) - 3600
+    for ID in IDs:
+        start = end - rng.randint(15 * 60, 3 * 3600)
+        project = rng.choices(projects, projectWeights)[0]
+        timeslots.append(
+            timeslot(
+                ID=ID,
+                start=start,
+                end=end,
+                project=project,
+                tags=rng.sample(tags[project], rng.randint(1, 3)),
+            )
+        )
+        end = start - rng.randint(0, 4 * 3600)
+
+    timeslots.reverse()
+    jkt.putTimeslots(timeslots)
+
+    return jkt
+
+
+def measure(fn, repeat: int, setup=None) -> float:
+    """
+    Returns the median time in seconds of fn(setup()) over repeat runs
+    """
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        t = perf_counter()
+        fn(arg)
+        times.append(perf_counter() - t)
+
+    return statistics.median(times)
+
+
+def runCLI(path: str, args: list[str]) -> None:
+    result = CliRunner().invoke(cli, args, obj={"jakt": jakt(path)})
+    if result.exception and not isinstance(result.exception, SystemExit):
+        raise result.exception
+
+
+def benchAPI(path: str, repeat: int) -> dict:
+    """
+    Times operations through the library, each on a freshly created jakt
+    """
+    fresh = lambda: jakt(path)
+
+    weekAgo = datetime.now() - timedelta(days=7)
+    someID = fresh().getTimeslots()[0].id
+
+    def start(jkt):
+        jkt.start(project="bench", tags=["start"])
+
+    def stop(jkt):
+        jkt.stop()
+
+    results = {}
+
+    results["start"] = measure(start, repeat, setup=lambda: stopped(fresh()))
+    results["stop"] = measure(stop, repeat, setup=lambda: started(fresh()))
+    results["status"] = measure(
+        lambda jkt: jkt.status(), repeat, setup=lambda: started(fresh())
+    )
+    stopped(fresh())
+    # Added timeslots follow each other, so none of them overlap
+    starts = iter(range(10000, 10**9, 1000))
+
+    def add(jkt):
+        start = next(starts)
+        jkt.add(timeslot(jkt.generateUniqueID(), start, start + 1000, "bench", ["add"]))
+
+    results["add"] = measure(add, repeat, setup=fresh)
+    results["ls"] = measure(lambda jkt: jkt.getTimeslots(), repeat, setup=fresh)
+    results["ls --from"] = measure(
+        lambda jkt: jkt.getTimeslots(from_=weekAgo, to=datetime.now()),
+        repeat,
+        setup=fresh,
+    )
+    results["edit"] = measure(
+        lambda jkt: jkt.editTimeslot(
+            someID, timeslot(someID, 1000, 3000, "bench", ["edit"])
+        ),
+        repeat,
+        setup=fresh,
+    )
+    results["report"] = measure(lambda jkt: jkt.report(), repeat, setup=fresh)
+    results["report --by week"] = measure(
+        lambda jkt: jkt.periodReport(by="week").getPeriodReport(), repeat, setup=fresh
+    )
+    results["export"] = measure(
+        lambda jkt: jkt.export("bench.csv"), repeat, setup=fresh
+    )
+    results["source"] = measure(
+        lambda jkt: jkt.importInternal("bench.csv"), repeat, setup=fresh
+    )
+    results["resume"] = measure(
+        lambda jkt: jkt.resume(), repeat, setup=lambda: stopped(fresh())
+    )
+    stopped(fresh())
+
+    return results
+
+
+def benchCLI(path: str, repeat: int) -> dict:
+    """
+    Times operations through the click CLI, each on a freshly created jakt
+    """
+    weekAgo = (datetime.now() - timedelta(days=7)).strftime("%d-%m-%y")
+    someID = jakt(path).getTimeslots()[0].id
+
+    commands = {
+        "start": (["start", "bench", "start"], lambda: stopped(jakt(path))),
+        "stop": (["stop"], lambda: started(jakt(path))),
+        "status": (["status"], lambda: started(jakt(path))),
+        "add": (
+            # The same timeslot every time, so overlaps are allowed
+            [
+                "add",
+                "--from",
+                "01-01-20 10:00",
+                "--to",
+                "01-01-20 11:00",
+                "--allow-overlap",
+                "bench",
+            ],
+            None,
+        ),
+        "ls": (["ls"], None),
+        "ls --from": (["ls", "--from", weekAgo], None),
+        "edit": (["edit", someID, "-p", "bench"], None),
+        "report": (["report"], None),
+        "report --by week": (["report", "--by", "week"], None),
+        "export": (["export", "bench.csv"], None),
+        "source": (["source", "bench.csv"], None),
+        "resume": (["resume"], lambda: stopped(jakt(path))),
+    }
+
+    results = {}
+    for name, (args, setup) in commands.items():
+        results[name] = measure(lambda _: runCLI(path, args), repeat, setup=setup)
+        if name == "status":
+            stopped(jakt(path))
+
+    stopped(jakt(path))
+
+    return results
+
+
+def benchStartup(repeat: int) -> float:
+    """
+    Returns the median time in seconds to start Python and import the CLI
+    """
+    args = [sys.executable, "-c", "import jakt.cli"]
+    return measure(lambda _: subprocess.run(args, check=True), max(repeat, 5))
+
+
+def started(jkt: jakt) -> jakt:
+    if not os.path.exists(jkt.pathCurrent):
+        jkt.start(project="bench", tags=["bench"])
+    return jkt
+
+
+def stopped(jkt: jakt) -> jakt:
+    if os.path.exists(jkt.pathCurrent):
+        jkt.stop()
+    return jkt
+
+
+def stressWorker(path: str, rounds: int, seed: int) -> int:
+    """
+    Starts, stops and adds timeslots in path, returns the number of timeslots stored
+    """
+    rng = random.Random(seed)
+    stored = 0
+
+    for _ in range(rounds):
+        jkt = jakt(path)
+        action = rng.choice(["start", "stop", "add"])
+
+        if action == "start":
+            try:
+                jkt.start(project="stress", tags=[f"worker{seed}"])
+            except JaktActiveError:
+                pass
+        elif action == "stop":
+            try:
+                jkt.stop()
+                stored += 1
+            except JaktNotActiveError:
+                pass
+        else:
+            jkt.add(
+                timeslot(jkt.generateUniqueID(), 1000, 2000, "stress", ["add"]),
+                allowOverlap=True,
+            )
+            stored += 1
+
+    return stored
+
+
+def stress(
+    path: str, processes: int, rounds: int = 50, storage: str = "json"
+) -> list[str]:
+    """
+    Runs stressWorker in processes processes at once on a new history in path.
+
+    Returns a list of problems found in the data afterwards, empty if there are none.
+    """
+    generate(path, 100, storage=storage)
+    before = len(jakt(path).getTimeslots())
+
+    with multiprocessing.Pool(processes) as pool:
+        stored = sum(
+            pool.starmap(stressWorker, [(path, rounds, i) for i in range(processes)])
+        )
+
+    jkt = jakt(path)
+    timeslots = jkt.getTimeslots()
+    IDs = [ts.id for ts in timeslots]
+
+    problems = []
+    if len(timeslots) != before + stored:
+        problems.append(f"{before + stored} timeslots stored, {len(timeslots)} found")
+    if len(set(IDs)) != len(IDs):
+        problems.append(f"{len(IDs) - len(set(IDs))} duplicate IDs")
+
+    records = sum(proj["records"] for proj in jkt.catalog.data.values())
+    if records != len(timeslots):
+        problems.append(f"Catalog counts {records} timeslots, {len(timeslots)} found")
+
+    return problems
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> list[dict]:
+    """
+    Returns the results that are more than threshold times slower than baseline
+    """
+    key = lambda r: (r["storage"], r["size"], r["interface"], r["operation"])
+    old = {key(r): r["seconds"] for r in baseline}
+
+    regressions = []
+    for r in results:
+        before = old.get(key(r))
+        if before and r["seconds"] > before * threshold:
+            regressions.append(dict(r, baseline=before))
+
+    return regressions
+
+
+@click.command()
+@click.option(
+    "--sizes",
+    default="1000,10000,100000",
+    help="Comma separated history sizes, up to 1000000",
+)
+@click.option(
+    "--storage", default="json", help="Comma separated storage backends to run"
+)
+@click.option("--repeat", default=3, help="Runs per operation, the median is kept")
+@click.option("--output", default="-", help="File for JSON results, - for stdout")
+@click.option("--compare", "baselinePath", default=None, help="Earlier results file")
+@click.option(
+    "--threshold", default=1.25, help="Slowdown factor counted as a regression"
+)
+@click.option(
+    "--startup-budget",
+    "startupBudget",
+    default=0.25,
+    help="Seconds allowed for starting the CLI",
+)
+@click.option(
+    "--stress",
+    "stressProcesses",
+    default=0,
+    help="Processes changing the same data at once, 0 to skip",
+)
+def main(
+    sizes,
+    storage,
+    repeat,
+    output,
+    baselinePath,
+    threshold,
+    startupBudget,
+    stressProcesses,
+):
+    """Benchmarks jakt on synthetic histories"""
+    startup = {
+        "storage": None,
+        "size": 0,
+        "interface": "cli",
+        "operation": "startup",
+        "seconds": benchStartup(repeat),
+    }
+    results = [startup]
+
+    problems = []
+    with tempfile.TemporaryDirectory(prefix="jakt-bench-") as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)
+
+        try:
+            for backend in storage.split(","):
+                for size in [int(s) for s in sizes.split(",")]:
+                    path = os.path.join(tmp, f"{backend}-{size}")
+                    click.echo(f"Generating {size} timeslots ({backend})", err=True)
+                    generate(path, size, storage=backend)
+
+                    for interface, bench in (("api", benchAPI), ("cli", benchCLI)):
+                        for operation, seconds in bench(path, repeat).items():
+                            results.append(
+                                {
+                                    "storage": backend,
+                                    "size": size,
+                                    "interface": interface,
+                                    "operation": operation,
+                                    "seconds": seconds,
+                                }
+                            )
+
+            for backend in storage.split(","):
+                if not stressProcesses:
+                    break
+
+                click.echo(f"Stress testing {stressProcesses} processes", err=True)
+                path = os.path.join(tmp, f"{backend}-stress")
+                for problem in stress(path, stressProcesses, storage=backend):
+                    problems.append(f"{backend}: {problem}")
+        finally:
+            os.chdir(cwd)
+
+    document = {
+        "jakt": version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "results": results,
+    }
+
+    regressions = []
+    if startup["seconds"] > startupBudget:
+        regressions.append(dict(startup, baseline=startupBudget))
+
+    if baselinePath:
+        with open(baselinePath, "r") as f:
+            baseline = json.load(f)
+        regressions += compare(results, baseline["results"], threshold)
+        document["regressions"] = regressions
+
+    if stressProcesses:
+        document["stress"] = problems
+
+    if output == "-":
+        click.echo(json.dumps(document, indent=2))
+    else:
+        with open(output, "w") as f:
+            json.dump(document, f, indent=2)
+
+    for r in regressions:
+        click.echo(
+            f"Regression: {r['operation']} ({r['interface']}, {r['storage']}, "
+            f"{r['size']}) took {r['seconds']:.4f}s, was {r['baseline']:.4f}s",
+            err=True,
+        )
+
+    for problem in problems:
+        click.echo(f"Stress: {problem}", err=True)
+
+    if regressions or problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import json
+import zlib
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+
+from .timeslot import timeslot, TimeslotTable
+from .atomic import atomicWrite
+
+
+MAGIC = b"JAKT"
+VERSION = 1
+
+# Stands in for a missing end or stat value
+NONE = -(2**63)
+
+# magic, version, rows, tag references, source key, checksum of the body
+header = struct.Struct("<4sH2xII6qI4x")
+
+
+def packKey(key: tuple) -> list[int]:
+    """
+    Returns the key of Journal.fileKey as six integers
+    """
+    values = []
+    for part in key:
+        values.extend(part if part is not None else (NONE, NONE, NONE))
+    return values
+
+
+def write(path: str, timeslots: list[timeslot], key: tuple) -> None:
+    """
+    Writes timeslots to a binary snapshot at path, valid while the source files have key.
+
+    Rows are sorted by start. Columns of starts, ends, position in the
+    order the timeslots were added, project and the first of its tag
+    references follow each other, then the tag references. Ids, projects
+    and tags are strings in a JSON table at the end, columns refer to
+    them by index.
+    """
+    rows = sorted(range(len(timeslots)), key=lambda i: timeslots[i].start)
+
+    projects = {}
+    tags = {}
+
+    starts = array("q")
+    ends = array("q")
+    added = array("I")
+    projectRefs = array("I")
+    tagStarts = array("I", [0])
+    tagRefs = array("I")
+    ids = []
+
+    for i in rows:
+        ts = timeslots[i]
+        ids.append(ts.id)
+        starts.append(ts.start)
+        ends.append(ts.end if ts.end is not None else NONE)
+        added.append(i)
+        projectRefs.append(projects.setdefault(ts.project, len(projects)))
+        for tag in ts.tags:
+            tagRefs.append(tags.setdefault(tag, len(tags)))
+        tagStarts.append(len(tagRefs))
+
+    strings = json.dumps(
+        {"ids": ids, "projects": list(projects), "tags": list(tags)}
+    ).encode()
+
+    body = b"".join(
+        column.tobytes()
+        for column in (starts, ends, added, projectRefs, tagStarts, tagRefs)
+    ) + strings
+
+    head = header.pack(
+        MAGIC,
+        VERSION,
+        len(timeslots),
+        len(tagRefs),
+        *packKey(key),
+        zlib.crc32(body),
+    )
+
+    # A cache, it is rebuilt if lost
+    atomicWrite(path, head + body, sync=False)
+
+
+class BinarySnapshot:
+    """
+    Timeslots read from a binary snapshot through mmap.
+
+    Columns are memoryviews into the mapped file, so range scans and
+    aggregates read them without creating a timeslot per row. open()
+    returns None if the file is missing, has another version, fails its
+    checksum or was written for other source files.
+    """
+
+    def __init__(self, buffer, rows: int, refs: int) -> None:
+        self.buffer = buffer
+        self.rows = rows
+
+        view = memoryview(buffer)
+        offset = header.size
+
+        def column(fmt: str, length: int):
+            nonlocal offset
+            size = struct.calcsize(fmt) * length
+            col = view[offset : offset + size].cast(fmt)
+            offset += size
+            return col
+
+        self.starts = column("q", rows)
+        self.ends = column("q", rows)
+        self.added = column("I", rows)
+        self.projectRefs = column("I", rows)
+        self.tagStarts = column("I", rows + 1)
+        self.tagRefs = column("I", refs)
+
+        strings = json.loads(bytes(view[offset:]))
+        self.ids = strings["ids"]
+        self.projects = strings["projects"]
+        self.tags = strings["tags"]
+
+    @classmethod
+    def open(cls, path: str, key: tuple):
+        try:
+            with open(path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            magic, version, rows, refs, *rest = header.unpack_from(buffer)
+            stored, checksum = rest[:6], rest[6]
+
+            if magic != MAGIC or version != VERSION or stored != packKey(key):
+                raise ValueError
+            if zlib.crc32(memoryview(buffer)[header.size :]) != checksum:
+                raise ValueError
+
+            return cls(buffer, rows, refs)
+        except (struct.error, ValueError, KeyError, TypeError):
+            buffer.close()
+            return None
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def bounds(self, from_: int = None, to: int = None) -> tuple:
+        """
+        Returns the rows (lo, hi) starting in [from_, to)
+        """
+        lo = 0
+        hi = self.rows
+        if from_ is not None:
+            lo = bisect_left(self.starts, from_)
+        if to is not None:
+            hi = bisect_left(self.starts, to, lo)
+
+        return lo, hi
+
+    def timeslot(self, row: int) -> timeslot:
+        end = self.ends[row]
+        refs = self.tagRefs[self.tagStarts[row] : self.tagStarts[row + 1]]
+
+        return timeslot(
+            ID=self.ids[row],
+            start=self.starts[row],
+            end=end if end != NONE else None,
+            project=self.projects[self.projectRefs[row]],
+            tags=[self.tags[i] for i in refs],
+        )
+
+    def timeslots(self) -> list[timeslot]:
+        """
+        Returns all timeslots in the order they were added
+        """
+        timeslots = [None] * self.rows
+        for row in range(self.rows):
+            timeslots[self.added[row]] = self.timeslot(row)
+
+        return timeslots
+
+    def table(self, from_: int = None, to: int = None) -> TimeslotTable:
+        """
+        Returns the completed timeslots starting in [from_, to) as a table
+        """
+        lo, hi = self.bounds(from_, to)
+
+        table = TimeslotTable()
+
+        rows = range(lo, hi)
+        if NONE in self.ends[lo:hi]:
+            # Active timeslots are left out, as in TimeslotTable.fromTimeslots
+            rows = [row for row in rows if self.ends[row] != NONE]
+            table.starts = array("q", [self.starts[row] for row in rows])
+            table.ends = array("q", [self.ends[row] for row in rows])
+        else:
+            # Copied straight from the mapped columns
+            table.starts.frombytes(self.starts[lo:hi].cast("B"))
+            table.ends.frombytes(self.ends[lo:hi].cast("B"))
+
+        projects = self.projects
+        tags = self.tags
+        tagStarts = self.tagStarts
+        tagRefs = self.tagRefs
+
+        table.ids = [self.ids[row] for row in rows]
+        table.projects = [projects[self.projectRefs[row]] for row in rows]
+        table.tags = [
+            [tags[i] for i in tagRefs[tagStarts[row] : tagStarts[row + 1]]]
+            for row in rows
+        ]
+
+        return table
@@ -0,0 +1,145 @@
+import json
+
+from .timeslot import timeslot
+from .atomic import atomicWrite
+from .exceptions import *
+
+
+class Catalog:
+    """
+    Projects and their tags with usage statistics.
+
+    For every project and every tag of a project the catalog keeps the
+    number of timeslots, when it was first used (earliest start) and when
+    it was last used (latest end). It is updated with every change, so
+    listing projects and tags does not read the timeslot history.
+
+    The catalog is stored as JSON together with the storage version it
+    matches. If the versions differ the catalog is rebuilt from storage.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.version = None
+        self.data = {}
+
+        try:
+            with open(self.path, "r") as f:
+                stored = json.load(f)
+            self.version = stored["version"]
+            self.data = stored["projects"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def save(self) -> None:
+        atomicWrite(self.path, json.dumps({"version": self.version, "projects": self.data}))
+
+    def rebuild(self, timeslots, version) -> None:
+        self.data = {}
+        for ts in timeslots:
+            self.add(ts)
+
+        self.version = version
+        self.save()
+
+    def update(self, added=(), removed=(), version=None) -> None:
+        for ts in removed:
+            self.remove(ts)
+
+        for ts in added:
+            self.add(ts)
+
+        self.version = version
+        self.save()
+
+    def add(self, ts: timeslot) -> None:
+        end = ts.end or ts.start
+
+        proj = self.data.get(ts.project)
+        if proj is None:
+            proj = self.data[ts.project] = {
+                "records": 0,
+                "first": ts.start,
+                "last": end,
+                "tags": {},
+            }
+        self.count(proj, ts.start, end, 1)
+
+        for tag in dict.fromkeys(ts.tags):
+            stats = proj["tags"].get(tag)
+            if stats is None:
+                stats = proj["tags"][tag] = {
+                    "records": 0,
+                    "first": ts.start,
+                    "last": end,
+                }
+            self.count(stats, ts.start, end, 1)
+
+    def remove(self, ts: timeslot) -> None:
+        """
+        Removes ts from the counts.
+
+        First and last used are left as they are, they are corrected the
+        next time the catalog is rebuilt.
+        """
+        proj = self.data.get(ts.project)
+        if proj is None:
+            return
+
+        for tag in dict.fromkeys(ts.tags):
+            stats = proj["tags"].get(tag)
+            if stats is None:
+                continue
+            stats["records"] -= 1
+            if stats["records"] <= 0:
+                del proj["tags"][tag]
+
+        proj["records"] -= 1
+        if proj["records"] <= 0:
+            del self.data[ts.project]
+
+    def count(self, stats: dict, start: int, end: int, records: int) -> None:
+        stats["records"] += records
+        stats["first"] = min(stats["first"], start)
+        stats["last"] = max(stats["last"], end)
+
+    ## Listing
+    def projects(self, sort: str = None) -> list[str]:
+        """
+        Returns all projects in the order they were first added.
+
+        sort can be "recency" for the most recently used first or
+        "frequency" for the most used first.
+        """
+        return self.sorted(self.data, sort)
+
+    def tags(self, project: str = None, sort: str = None) -> list[str]:
+        """
+        Returns the tags of project, or of all projects if not given.
+
+        sort works as in projects().
+        """
+        if project:
+            return self.sorted(self.data.get(project, {"tags": {}})["tags"], sort)
+
+        tags = {}
+        for proj in self.data.values():
+            for tag, stats in proj["tags"].items():
+                if tag not in tags:
+                    tags[tag] = dict(stats)
+                else:
+                    self.count(tags[tag], stats["first"], stats["last"], stats["records"])
+
+        return self.sorted(tags, sort)
+
+    def sorted(self, stats: dict, sort: str = None) -> list[str]:
+        if sort == "recency":
+            return sorted(stats, key=lambda name: stats[name]["last"], reverse=True)
+
+        if sort == "frequency":
+            return sorted(stats, key=lambda name: stats[name]["records"], reverse=True)
+
+        if sort is not None:
+            raise JaktInputError(f"Unknown sort order '{sort}'.")
+
+        return list(stats)
@@ -1,11 +1,55 @@
+import os
 import click
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from .__init__ import jakt
+from .daemon import Client, connect
 from .timeslot import timeslot
+from .analytics import WEEKDAYS
 from .exceptions import *
 
 
+def period(from_: datetime, to: datetime) -> tuple:
+    """
+    Sanitizes --from/--to dates.
+
+    Returns (from_, to) where to is exclusive, so the day given with --to
+    is included. Both are None if neither is set.
+    """
+    if not (from_ or to):
+        return None, None
+
+    if to and (not from_):
+        raise click.UsageError("--from must be set if --to is set")
+
+    if not to:
+        return from_, datetime.now()
+
+    if from_ > to:
+        # Switch the parameters if they are given in the wrong order
+        from_, to = to, from_
+        click.echo("--to/--from in wrong order. Flipping them.")
+
+    return from_, to + timedelta(days=1)
+
+
+def completeProject(ctx, param, incomplete):
+    """
+    Shell completion of projects, most recently used first
+    """
+    projects = (connect() or jakt()).getProjects(sort="recency")
+    return [p for p in projects if p.startswith(incomplete)]
+
+
+def completeTag(ctx, param, incomplete):
+    """
+    Shell completion of tags for the project given, most used first
+    """
+    project = ctx.params.get("project")
+    tags = (connect() or jakt()).getTags(project=project, sort="frequency")
+    return [t for t in tags if t.startswith(incomplete)]
+
+
 @click.group()
 @click.version_option(version="0.0.7", prog_name="jakt (dev)")
 @click.pass_context
@@ -18,15 +62,17 @@ def cli(ctx):
     accountable while working, jakt is the perfect tool."""
 
     ctx.ensure_object(dict)
-    ctx.obj["jakt"] = jakt()
+    if "jakt" not in ctx.obj:
+        # Uses the daemon if `jakt serve` is running
+        ctx.obj["jakt"] = connect() or jakt()
 
     if ctx.obj["jakt"].getConfig()['debug']:
         click.echo("Debug mode is enabled")
 
 
 @cli.command()
-@click.argument("project")
-@click.argument("tags", nargs=-1)
+@click.argument("project", shell_complete=completeProject)
+@click.argument("tags", nargs=-1, shell_complete=completeTag)
 @click.pass_context
 def start(ctx, project, tags):
     """Start a new timeslot"""
@@ -71,38 +117,94 @@ def stop(ctx):
         click.echo(f"Tags: {tags}")
         click.echo(f"Timer ran for {runtime}")
 
+        for other in jkt.overlaps(ts.start, ts.end, exclude=[ts.id]):
+            click.echo(click.style(f"Overlaps {other.toHR()}", fg="yellow"))
+
     except JaktNotActiveError:
         click.echo("No timer started.")
 
 
 @cli.command()
+@click.option(
+    "-w",
+    "--watch",
+    is_flag=True,
+    default=False,
+    help="Keep running, print the status when it changes and every minute",
+)
+@click.option(
+    "-f",
+    "--format",
+    "template",
+    default=None,
+    help="Template like '{project} {elapsed}', fields: project, tags, start, elapsed, hours, minutes",
+)
+@click.option("--json", "asJSON", is_flag=True, default=False, help="Print status as JSON")
+@click.option(
+    "--idle",
+    default="No timer started.",
+    help="Text printed with --format when no timer runs",
+)
 @click.pass_context
-def status(ctx):
+def status(ctx, watch, template, asJSON, idle):
     """Displays current status"""
     jkt = ctx.obj["jakt"]
 
+    if not watch:
+        try:
+            printStatus(jkt.status(), template, asJSON, idle)
+        except JaktNotActiveError:
+            printStatus(None, template, asJSON, idle)
+        return
+
     try:
-        response = jkt.status()
+        for response in jkt.watchStatus():
+            printStatus(response, template, asJSON, idle)
+    except KeyboardInterrupt:
+        pass
 
-        project = click.style(response["project"], fg="blue", bold=True)
-        hrStart = click.style(
-            datetime.fromtimestamp(response["start"]).strftime("%H:%M"),
-            fg="red",
-            bold=True,
-        )
-        tags = click.style(" ".join(str(t) for t in response["tags"]), fg="green")
-        runtime = click.style(
-            f"{response['elapsedHour']:02}:{response['elapsedMin']:02}",
-            fg="green",
-            bold=True,
-        )
 
-        click.echo(f"{project} started at {hrStart}.")
-        click.echo(f"Tags: {tags}")
-        click.echo(f"Runtime is {runtime}")
+def printStatus(response: dict, template: str, asJSON: bool, idle: str) -> None:
+    """
+    Prints the status given by jakt.status, or None if no timer runs
+    """
+    if asJSON:
+        import json
 
-    except JaktNotActiveError:
-        click.echo("No timer started.")
+        click.echo(json.dumps(dict(response or {}, active=response is not None)))
+        return
+
+    if response is None:
+        click.echo(idle if template is not None else "No timer started.")
+        return
+
+    start = datetime.fromtimestamp(response["start"]).strftime("%H:%M")
+    elapsed = f"{response['elapsedHour']:02}:{response['elapsedMin']:02}"
+
+    if template is not None:
+        try:
+            click.echo(
+                template.format(
+                    project=response["project"],
+                    tags=" ".join(str(t) for t in response["tags"]),
+                    start=start,
+                    elapsed=elapsed,
+                    hours=response["elapsedHour"],
+                    minutes=response["elapsedMin"],
+                )
+            )
+        except (KeyError, IndexError, ValueError) as e:
+            raise click.UsageError(f"Invalid --format template: {e}")
+        return
+
+    project = click.style(response["project"], fg="blue", bold=True)
+    hrStart = click.style(start, fg="red", bold=True)
+    tags = click.style(" ".join(str(t) for t in response["tags"]), fg="green")
+    runtime = click.style(elapsed, fg="green", bold=True)
+
+    click.echo(f"{project} started at {hrStart}.")
+    click.echo(f"Tags: {tags}")
+    click.echo(f"Runtime is {runtime}")
 
 
 @cli.command()
@@ -110,13 +212,13 @@ def status(ctx):
     "--to",
     "to",
     type=click.DateTime(formats=["%d-%m-%y"]),
-    help="Starttime of search period",
+    help="Last day of search period",
 )
 @click.option(
     "--from",
     "from_",
     type=click.DateTime(formats=["%d-%m-%y"]),
-    help="Endtime of search period",
+    help="First day of search period",
 )
 @click.option(
     "-c",
@@ -128,8 +230,15 @@ def status(ctx):
 @click.option("-p", "--projects", is_flag=True, default=False, help="Display projects")
 @click.option("-t", "--tags", is_flag=True, default=False, help="Display tags")
 @click.option("-a", "--all", "_all" ,is_flag=True, default=False, help="Display all elements")
+@click.option(
+    "-s",
+    "--sort",
+    type=click.Choice(["recency", "frequency"]),
+    default=None,
+    help="Order of projects and tags",
+)
 @click.pass_context
-def ls(ctx, to, from_, category, projects, tags, _all):
+def ls(ctx, to, from_, category, projects, tags, _all, sort):
     """Lists timeslots and other data"""
     jkt = ctx.obj["jakt"]
 
@@ -145,7 +254,7 @@ def ls(ctx, to, from_, category, projects, tags, _all):
         return
 
     if projects:
-        projects = jkt.getProjects()
+        projects = jkt.getProjects(sort=sort)
 
         for i in range(len(projects)):
             if i == 10 and not _all:
@@ -156,7 +265,7 @@ def ls(ctx, to, from_, category, projects, tags, _all):
         return
 
     if tags:
-        tags = jkt.getTags()
+        tags = jkt.getTags(sort=sort)
 
         for i in range(len(tags)):
             if i == 10 and not _all:
@@ -166,25 +275,8 @@ def ls(ctx, to, from_, category, projects, tags, _all):
 
         return
 
-    if from_ or to:
-        # A few cases of input sanitation
-        if from_ and (not to):
-            to = datetime.now()
-
-        elif to and (not from_):
-            click.echo("--from must be set if --to is set")
-            return
-
-        if from_ > to:
-            # Switch the parameters if they are given in the wrong order
-            a = from_
-            from_ = to
-            to = a
-            click.echo("--to/--from in wrong order. Flipping them.")
-
-        timeslots = jkt.getTimeslots(to, from_)
-    else:
-        timeslots = jkt.getTimeslots()
+    from_, to = period(from_, to)
+    timeslots = jkt.getTimeslots(from_=from_, to=to)
 
     # Want timeslots sorted chronologically
     timeslots.reverse()
@@ -214,10 +306,17 @@ def ls(ctx, to, from_, category, projects, tags, _all):
     help="Endtime",
     required=True,
 )
+@click.option(
+    "--allow-overlap",
+    "allowOverlap",
+    is_flag=True,
+    default=False,
+    help="Add it even if it overlaps other timeslots",
+)
 @click.argument("project")
 @click.argument("tags", nargs=-1)
 @click.pass_context
-def add(ctx, to, from_, project, tags):
+def add(ctx, to, from_, allowOverlap, project, tags):
     """Add a timeslot that was not logged live"""
     jkt = ctx.obj["jakt"]
 
@@ -229,11 +328,14 @@ def add(ctx, to, from_, project, tags):
         tags=tags,
     )
 
-    jkt.add(ts)
+    try:
+        jkt.add(ts, allowOverlap=allowOverlap)
+    except JaktOverlapError as e:
+        click.echo(f"Not added, {e.args[0]} Use --allow-overlap to add it anyway.")
 
 
 @cli.command()
-@click.argument("id")
+@click.argument("ids", nargs=-1, required=True)
 @click.option(
     "-s",
     "--start",
@@ -265,62 +367,339 @@ def add(ctx, to, from_, project, tags):
     help="Tag, can be used multiple times",
     default=None,
 )
+@click.option(
+    "--allow-overlap",
+    "allowOverlap",
+    is_flag=True,
+    default=False,
+    help="Change them even if they overlap other timeslots",
+)
 @click.pass_context
-def edit(ctx, id, start, end, project, tags):
+def edit(ctx, ids, start, end, project, tags, allowOverlap):
     """
     Edits timeslots. \n
-    The given timeslot is the baseline and modified with the changes given in this command.
+    Each given timeslot is the baseline and modified with the changes given in this command.
+    All timeslots are changed together.
     """
     jkt = ctx.obj["jakt"]
 
-    ts = jkt.getTimeslot(queryId=id)
-    
-    # Get all parameters current for matching timeslot 
-    newStart = ts.start
-    newEnd = ts.end
-    newProject = ts.project
-    newTags = ts.tags
+    changes = {}
+    for id in ids:
+        ts = jkt.getTimeslot(queryId=id)
+        if not ts:
+            click.echo(f"No timeslot with ID {id}.")
+            return
+
+        # Get all parameters current for matching timeslot 
+        newStart = ts.start
+        newEnd = ts.end
+        newProject = ts.project
+        newTags = ts.tags
+
+        # Update given fields
+        if start is not None:
+            newStart = int(start.timestamp())
+
+        if end is not None:
+            newEnd = int(end.timestamp())
+
+        if project is not None:
+            newProject = project
+
+        if tags != ():
+            newTags = list(tags)
 
-    # Update given fields
-    if start is not None:
-        newStart = int(start.timestamp())
+        # Initialize new timeslot
+        changes[id] = timeslot(
+                ID = id,
+                start = newStart,
+                end = newEnd,
+                project = newProject,
+                tags = newTags,
+            )
+
+    # Update the entries in data
+    try:
+        jkt.editTimeslots(changes, allowOverlap=allowOverlap)
+    except JaktInputError as e:
+        # Removed since it was read
+        click.echo(e.args[0])
+        return
+    except JaktOverlapError as e:
+        click.echo(f"Not changed, {e.args[0]} Use --allow-overlap to change it anyway.")
+        return
 
-    if end is not None:
-        newEnd = int(end.timestamp())
+    # Print the updated timeslots
+    for newTS in changes.values():
+        click.echo(newTS.toHR())
 
+
+
+@cli.group()
+def bulk():
+    """Changes all timeslots matching a filter at once"""
+
+
+def bulkFilters(command):
+    """
+    Adds the options selecting timeslots and --dry-run to a bulk command
+    """
+    options = [
+        click.option("-p", "--project", default=None, help="Only timeslots of project"),
+        click.option("-t", "--tag", default=None, help="Only timeslots with tag"),
+        click.option(
+            "--from",
+            "from_",
+            type=click.DateTime(formats=["%d-%m-%y"]),
+            help="First day of period",
+        ),
+        click.option(
+            "--to",
+            "to",
+            type=click.DateTime(formats=["%d-%m-%y"]),
+            help="Last day of period",
+        ),
+        click.option(
+            "-n",
+            "--dry-run",
+            "dryRun",
+            is_flag=True,
+            default=False,
+            help="Only count the timeslots that would change",
+        ),
+    ]
+    for option in reversed(options):
+        command = option(command)
+
+    return command
+
+
+def bulkRun(ctx, method: str, *args, project, tag, from_, to, dryRun) -> None:
+    """
+    Runs the bulk change method of jakt and prints how many timeslots it changed
+    """
+    jkt = ctx.obj["jakt"]
+
+    from_, to = period(from_, to)
+
+    filters = {"from_": from_ or False, "to": to or False, "dryRun": dryRun}
     if project is not None:
-        newProject = project
-
-    if tags != ():
-        newTags = list(tags)
-
-    # Initialize new timeslot
-    newTS = timeslot(
-            ID = id,
-            start = newStart,
-            end = newEnd,
-            project = newProject,
-            tags = newTags,
-        )
+        filters["project"] = project
+    if tag is not None:
+        filters["tag"] = tag
+
+    count = getattr(jkt, method)(*args, **filters)
+
+    verb = "would change" if dryRun else "changed"
+    click.echo(f"{count} timeslots {verb}.")
+
+
+@bulk.command("move")
+@click.argument("new_project")
+@bulkFilters
+@click.pass_context
+def bulkMove(ctx, new_project, **filters):
+    """Moves timeslots to another project"""
+    bulkRun(ctx, "moveTimeslots", new_project, **filters)
+
+
+@bulk.command("rename")
+@click.argument("old_project", shell_complete=completeProject)
+@click.argument("new_project")
+@bulkFilters
+@click.pass_context
+def bulkRename(ctx, old_project, new_project, **filters):
+    """Renames a project, merging it into NEW_PROJECT if that exists"""
+    if filters["project"] is not None:
+        raise click.UsageError("--project can not be used with rename.")
 
-    # Update the entry in data
-    jkt.editTimeslot(queryId=id, ts=newTS)
+    bulkRun(ctx, "renameProject", old_project, new_project, **filters)
 
-    # Print the updated timeslot
-    click.echo(newTS.toHR())
 
+@bulk.command("retag")
+@click.argument("old_tag")
+@click.argument("new_tag")
+@bulkFilters
+@click.pass_context
+def bulkRetag(ctx, old_tag, new_tag, **filters):
+    """Renames a tag, merging it into NEW_TAG if that exists"""
+    if filters["tag"] is not None:
+        raise click.UsageError("--tag can not be used with retag.")
+
+    bulkRun(ctx, "renameTag", old_tag, new_tag, **filters)
+
+
+@bulk.command("tag")
+@click.argument("tags", nargs=-1, required=True)
+@bulkFilters
+@click.pass_context
+def bulkTag(ctx, tags, **filters):
+    """Adds tags to timeslots"""
+    bulkRun(ctx, "addTags", list(tags), **filters)
+
+
+@bulk.command("untag")
+@click.argument("tags", nargs=-1, required=True)
+@bulkFilters
+@click.pass_context
+def bulkUntag(ctx, tags, **filters):
+    """Removes tags from timeslots"""
+    bulkRun(ctx, "removeTags", list(tags), **filters)
+
+
+@cli.group()
+def check():
+    """Checks tracked time for problems"""
+
+
+@check.command("overlaps")
+@click.option(
+    "--max-gap",
+    "maxGap",
+    type=int,
+    default=None,
+    help="Also list untracked gaps up to this many minutes",
+)
+@click.pass_context
+def checkOverlaps(ctx, maxGap):
+    """Lists timeslots that overlap each other"""
+    jkt = ctx.obj["jakt"]
+
+    result = jkt.checkOverlaps()
+
+    for first, second, seconds in result["overlaps"]:
+        hrTime = click.style(f"{seconds // 60} min", fg="red", bold=True)
+        click.echo(f"{hrTime} overlap")
+        click.echo(f"  {first.toHR()}")
+        click.echo(f"  {second.toHR()}")
+
+    click.echo(f"{len(result['overlaps'])} overlaps.")
+
+    if maxGap is None:
+        return
+
+    gaps = [(end, start) for end, start in result["gaps"] if start - end <= maxGap * 60]
+    for end, start in gaps:
+        hrEnd = datetime.fromtimestamp(end).strftime("%H:%M %d-%m-%y")
+        hrStart = datetime.fromtimestamp(start).strftime("%H:%M %d-%m-%y")
+        click.echo(f"Gap of {(start - end) // 60} min from {hrEnd} to {hrStart}")
+
+    click.echo(f"{len(gaps)} gaps of at most {maxGap} min.")
+
+
+@check.command("at")
+@click.argument(
+    "moment", type=click.DateTime(formats=["%d-%m-%y %H:%M", "%d-%m-%y %H:%M:%S"])
+)
+@click.pass_context
+def checkAt(ctx, moment):
+    """Shows what was tracked at MOMENT"""
+    jkt = ctx.obj["jakt"]
+
+    timeslots = jkt.at(moment)
+    if not timeslots:
+        click.echo("Nothing tracked at that time.")
+
+    for ts in timeslots:
+        if ts.end is None:
+            project = click.style(ts.project, fg="blue", bold=True)
+            click.echo(f"{ts.id} {project} (running) {' '.join(ts.tags)}")
+        else:
+            click.echo(ts.toHR())
 
 
 @cli.command()
 @click.option("-p", "--project", default="", help="Show only specified project")
 @click.option("-t", "--tag", default="", help="Show only specified tag")
+@click.option(
+    "--to",
+    "to",
+    type=click.DateTime(formats=["%d-%m-%y"]),
+    help="Last day of report period",
+)
+@click.option(
+    "--from",
+    "from_",
+    type=click.DateTime(formats=["%d-%m-%y"]),
+    help="First day of report period",
+)
+@click.option(
+    "--by",
+    type=click.Choice(["day", "week", "month"]),
+    help="Split report into days, weeks or months",
+)
+@click.option(
+    "--heatmap",
+    is_flag=True,
+    default=False,
+    help="Show tracked time by weekday and hour of day",
+)
 @click.pass_context
-def report(ctx, project, tag):
+def report(ctx, project, tag, to, from_, by, heatmap):
     """Generates reports from timetracker data"""
     jkt = ctx.obj["jakt"]
 
-    jkt_report = jkt.report()
+    from_, to = period(from_, to)
+
+    if heatmap:
+        printHeatmap(jkt.heatmap(from_=from_ or False, to=to or False, project=project, tag=tag))
+        return
+
+    if by:
+        printPeriodReport(jkt.periodReport(by=by, from_=from_, to=to), project, tag)
+        return
+
+    printReport(jkt.report(from_=from_, to=to), project, tag)
 
+
+@cli.command("team-report")
+@click.argument("paths", nargs=-1, required=True, type=click.Path(file_okay=False))
+@click.option("-p", "--project", default="", help="Show only specified project")
+@click.option("-t", "--tag", default="", help="Show only specified tag")
+@click.option(
+    "--to",
+    "to",
+    type=click.DateTime(formats=["%d-%m-%y"]),
+    help="Last day of report period",
+)
+@click.option(
+    "--from",
+    "from_",
+    type=click.DateTime(formats=["%d-%m-%y"]),
+    help="First day of report period",
+)
+@click.option(
+    "--by",
+    type=click.Choice(["day", "week", "month"]),
+    help="Split report into days, weeks or months",
+)
+@click.option("-j", "--jobs", type=click.IntRange(min=1), help="Number of worker processes")
+def teamReport(paths, project, tag, to, from_, by, jobs):
+    """Generates a combined report over the data directories of several users"""
+    from .team import TeamReport
+
+    from_, to = period(from_, to)
+
+    try:
+        team = TeamReport(list(paths), from_=from_ or False, to=to or False, by=by, workers=jobs)
+    except JaktPathError as e:
+        raise click.BadParameter(f"{e.path} is not a jakt data directory.", param_hint="PATHS")
+
+    if by:
+        printPeriodReport(team.periods, project, tag)
+    else:
+        printReport(team, project, tag)
+
+    for name, user in team.users.items():
+        click.echo()
+        click.echo(click.style(name, bold=True, underline=True))
+        printReport(user, project, tag)
+
+
+def printReport(jkt_report, project="", tag="") -> None:
+    """
+    Prints the project and tag totals of a JaktReport
+    """
     if project:
         projects = jkt_report.getProjectReport(project=project)
     else:
@@ -345,6 +724,62 @@ def report(ctx, project, tag):
             click.echo(f" - {hrTag}  {hrTagTime}")
 
 
+def printPeriodReport(periodReport, project="", tag="") -> None:
+    """
+    Prints the project and tag totals of every period of a PeriodReport
+    """
+    for period_ in periodReport.getPeriodReport(project=project, tag=tag):
+        if not period_["projects"]:
+            continue
+
+        click.echo(click.style(period_["period"], bold=True, underline=True))
+        for proj in period_["projects"]:
+            hrProject = click.style(proj["project"], fg="blue", bold=True)
+            hrTime = click.style(proj["time"], fg="red", bold=True)
+            click.echo(f"{hrProject}  {hrTime}")
+
+            for tg in proj["tags"]:
+                hrTag = click.style(tg["tag"], fg="green", bold=True)
+                hrTagTime = click.style(tg["time"], fg="yellow")
+                click.echo(f" - {hrTag}  {hrTagTime}")
+
+
+def printHeatmap(heatmap) -> None:
+    """
+    Prints a Heatmap as a weekday x hour grid followed by the tracked share of every hour
+    """
+    data = heatmap.data
+    if not data["days"]:
+        click.echo("No timeslots tracked in this period.")
+        return
+
+    shades = " ░▒▓█"
+    peak = max(max(row) for row in data["weekdays"])
+
+    click.echo(("     " + "".join(f"{h:<6}" for h in range(0, 24, 3))).rstrip())
+    for name, row in zip(WEEKDAYS, data["weekdays"]):
+        cells = "".join(
+            shades[-(-seconds * (len(shades) - 1) // peak)] * 2 for seconds in row
+        )
+        click.echo(f"{click.style(name, bold=True)}  {click.style(cells, fg='blue')}")
+
+    click.echo()
+    click.echo(click.style("Tracked share of each hour", bold=True, underline=True))
+    for hour, share in enumerate(data["hours"]):
+        if share:
+            bar = click.style("█" * round(share * 40), fg="red")
+            click.echo(f"{hour:02}:00  {share:6.1%}  {bar}")
+
+    days = data["days"]
+    total = sum(days.values())
+    hrs, rem = divmod(total // len(days), 3600)
+    click.echo()
+    click.echo(
+        f"{len(days)} days with tracked time from {data['first']} to {data['last']}, "
+        f"{hrs:02}:{rem // 60:02} per day on average."
+    )
+
+
 @cli.command()
 @click.pass_context
 def resume(ctx):
@@ -434,15 +869,31 @@ def debug(ctx, state: bool = None):
 
 @cli.command()
 @click.argument("path", type=str, required=False, default=None)
+@click.option(
+    "--to",
+    "to",
+    type=click.DateTime(formats=["%d-%m-%y"]),
+    help="Last day to export",
+)
+@click.option(
+    "--from",
+    "from_",
+    type=click.DateTime(formats=["%d-%m-%y"]),
+    help="First day to export",
+)
+@click.option("-p", "--project", default="", help="Export only specified project")
+@click.option("-t", "--tag", default="", help="Export only specified tag")
 @click.pass_context
-def export(ctx, path):
+def export(ctx, path, to, from_, project, tag):
     """
-    Exports all timeslots to given .csv file
+    Exports timeslots to given .csv file, use - for stdout
     """
     jkt = ctx.obj["jakt"]
 
+    from_, to = period(from_, to)
+
     try:
-        jkt.export(path=path)
+        jkt.export(path=path, from_=from_, to=to, project=project, tag=tag)
     except JaktPathError as e:
         click.echo(f"JaktPathError: {e}")
 
@@ -457,17 +908,130 @@ def source(ctx, path, _format):
     """
     jkt = ctx.obj["jakt"]
 
+    def progress(rows):
+        click.echo(f"Read {rows} rows...", err=True)
+
     try:
         if _format != "jakt":
-            jkt.importTT(path=path)
-            return
-        
-        jkt.importInternal(path=path, _format=_format)
+            counts = jkt.importTT(path=path, progress=progress)
+        else:
+            counts = jkt.importInternal(path=path, progress=progress)
+
+    except JaktPathError as e:
+        click.echo(f"JaktPathError: {e}")
+        return
+
+    click.echo(
+        f"Added {counts['added']} timeslots, "
+        f"skipped {counts['skipped']} already logged "
+        f"and {counts['invalid']} invalid rows."
+    )
+
+
+@cli.command()
+@click.argument("path", type=click.Path(file_okay=False))
+@click.option(
+    "--policy",
+    type=click.Choice(["ours", "theirs", "both"]),
+    default="ours",
+    help="Timeslot kept when both directories have a different version",
+)
+@click.option(
+    "--dry-run", "dryRun", is_flag=True, default=False, help="Only count the changes"
+)
+@click.pass_context
+def merge(ctx, path, policy, dryRun):
+    """
+    Merges the timeslots of another data directory into these
+    """
+    jkt = ctx.obj["jakt"]
+
+    try:
+        counts = jkt.merge(path, policy=policy, dryRun=dryRun)
+    except JaktPathError as e:
+        raise click.BadParameter(f"{e.path} is not a jakt data directory.", param_hint="PATH")
+    except JaktInputError as e:
+        raise click.UsageError(str(e))
+
+    verb = "Would add" if dryRun else "Added"
+    click.echo(
+        f"{verb} {counts['added']} timeslots, "
+        f"replaced {counts['replaced']} "
+        f"and skipped {counts['skipped']} already logged. "
+        f"{counts['conflicts']} conflicts."
+    )
+
+
+@cli.command()
+@click.pass_context
+def compact(ctx):
+    """
+    Folds the journal of changes into the timeslot file
+    """
+    jkt = ctx.obj["jakt"]
 
+    try:
+        records = jkt.compact()
+        click.echo(f"Compacted {records} journal records.")
     except JaktPathError as e:
         click.echo(f"JaktPathError: {e}")
 
 
+@cli.command()
+@click.pass_context
+def serve(ctx):
+    """
+    Keeps data in memory and answers other jakt commands until stopped
+    """
+    from .daemon import Server
+
+    if isinstance(ctx.obj["jakt"], Client):
+        click.echo("jakt serve is already running.")
+        return
+
+    server = Server(dataPath=os.path.dirname(ctx.obj["jakt"].pathSocket))
+    click.echo(f"Serving on {server.path}, stop with Ctrl-C.")
+
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+@cli.command()
+@click.option(
+    "--pull",
+    "pullOnly",
+    is_flag=True,
+    default=False,
+    help="Only merge the remote changes, do not send local ones",
+)
+@click.pass_context
+def sync(ctx, pullOnly):
+    """
+    Synchronizes timeslots with the remote set in config
+    """
+    jkt = ctx.obj["jakt"]
+
+    try:
+        result = jkt.pull() if pullOnly else jkt.push()
+    except JaktRemoteError as e:
+        click.echo(e.args[0])
+        return
+
+    click.echo(
+        f"{result['added']} added, {result['changed']} changed and "
+        f"{result['removed']} removed from the remote."
+    )
+    if result["conflicts"]:
+        click.echo(
+            click.style(f"{result['conflicts']} timeslots were changed on both sides,", fg="yellow")
+            + " the same version was kept everywhere."
+        )
+    if not pullOnly:
+        click.echo(f"{result['pushed']} months sent.")
+
+
 @cli.command()
 @click.pass_context
 def path(ctx):
@@ -485,11 +1049,6 @@ def path(ctx):
     click.echo(pathString)
 
 """
-@cli.command()
-def sync():
-    # Syncronizes data with server
-    pass
-
 @cli.command()
 def license():
     # Outputs license
@@ -0,0 +1,371 @@
+"""
+Daemon keeping jakt data in memory, see `jakt serve`.
+
+The daemon answers requests on a Unix domain socket in the data
+directory. Each request is one JSON line naming a jakt method and its
+arguments, the answer is one JSON line with the return value or the
+exception raised. Timeslots, dates and reports are tagged so they are
+rebuilt on the other side.
+
+Client has the same methods as jakt. Methods the daemon serves are
+forwarded to it, everything else, and every call made while the daemon
+is not reachable, runs on a local jakt. A change the daemon stops
+answering is not run again, it may already have been written.
+"""
+import os
+import json
+import socket
+from datetime import date, datetime
+
+from . import jakt
+from .timeslot import timeslot
+from .report import JaktReport, PeriodReport
+from .analytics import Heatmap
+from . import exceptions
+from .exceptions import *
+
+
+# Methods answered by the daemon
+SERVED = {
+    "start",
+    "stop",
+    "status",
+    "resume",
+    "add",
+    "editTimeslot",
+    "editTimeslots",
+    "removeTimeslot",
+    "moveTimeslots",
+    "renameProject",
+    "renameTag",
+    "addTags",
+    "removeTags",
+    "getTimeslot",
+    "getTimeslots",
+    "getProjects",
+    "getTags",
+    "getCategories",
+    "generateUniqueID",
+    "generateUniqueIDs",
+    "compact",
+    "report",
+    "periodReport",
+    "heatmap",
+    "overlaps",
+    "at",
+    "checkOverlaps",
+    "fetch",
+    "pull",
+    "push",
+    "getConfig",
+    "putConfig",
+    "getPath",
+}
+
+# Served methods that do not change data, safe to run again locally
+READING = {
+    "status",
+    "getTimeslot",
+    "getTimeslots",
+    "getProjects",
+    "getTags",
+    "getCategories",
+    "generateUniqueID",
+    "generateUniqueIDs",
+    "report",
+    "periodReport",
+    "heatmap",
+    "overlaps",
+    "at",
+    "checkOverlaps",
+    "getConfig",
+    "getPath",
+}
+
+
+def socketPath(dataPath: str = None) -> str:
+    """
+    Returns the path of the daemon socket for the data in dataPath
+    """
+    if dataPath is None:
+        from platformdirs import user_data_dir
+
+        dataPath = user_data_dir(appname="Jakt")
+
+    return os.path.join(dataPath, "jakt.sock")
+
+
+## Messages
+def encode(value):
+    """
+    JSON encoder for values json does not handle
+    """
+    if isinstance(value, timeslot):
+        return {"__type__": "timeslot", "value": value.toDict()}
+
+    if isinstance(value, datetime):
+        return {"__type__": "datetime", "value": value.timestamp()}
+
+    if isinstance(value, date):
+        return {"__type__": "date", "value": value.isoformat()}
+
+    if isinstance(value, (JaktReport, PeriodReport, Heatmap)):
+        return {"__type__": type(value).__name__, "value": value.data}
+
+    if isinstance(value, (set, tuple)):
+        return list(value)
+
+    raise TypeError(f"{type(value).__name__} can not be sent to the daemon")
+
+
+def decode(obj: dict):
+    """
+    JSON object hook rebuilding the values tagged by encode
+    """
+    kind = obj.get("__type__")
+    if kind is None:
+        return obj
+
+    value = obj["value"]
+
+    if kind == "timeslot":
+        return timeslot.from_json(value)
+
+    if kind == "datetime":
+        return datetime.fromtimestamp(value)
+
+    if kind == "date":
+        return date.fromisoformat(value)
+
+    if kind in ("JaktReport", "PeriodReport", "Heatmap"):
+        cls = {"JaktReport": JaktReport, "PeriodReport": PeriodReport, "Heatmap": Heatmap}[kind]
+        report = cls.__new__(cls)
+        report.data = value
+        return report
+
+    return obj
+
+
+def dumps(message: dict) -> bytes:
+    return (json.dumps(message, default=encode) + "\n").encode()
+
+
+def loads(line: bytes) -> dict:
+    return json.loads(line, object_hook=decode)
+
+
+## Server
+class Server:
+    """
+    Serves requests for the jakt in dataPath on its socket.
+
+    Requests are handled one at a time on a jakt that is kept between
+    them, so parsed timeslots and indexes stay in memory. Changes are
+    written to disk before they are answered, under the same file lock as
+    every other jakt process. The jakt is created again if config.yml
+    changes.
+    """
+
+    def __init__(self, dataPath: str = None) -> None:
+        self.dataPath = dataPath
+        self.jkt = jakt(dataPath)
+        self.configKey = self.statConfig()
+        self.path = self.jkt.pathSocket
+
+    def statConfig(self) -> tuple:
+        st = os.stat(self.jkt.pathConfig)
+        return (st.st_mtime_ns, st.st_size)
+
+    def handle(self, request: dict) -> dict:
+        """
+        Calls the requested method and returns the answer
+        """
+        method = request.get("method")
+        if method not in SERVED:
+            return {"error": "JaktError", "args": [f"Unknown method '{method}'."]}
+
+        if self.statConfig() != self.configKey:
+            self.jkt = jakt(self.dataPath)
+            self.configKey = self.statConfig()
+
+        try:
+            result = getattr(self.jkt, method)(
+                *request.get("args", []), **request.get("kwargs", {})
+            )
+        except JaktError as e:
+            return {"error": type(e).__name__, "args": list(e.args)}
+        except Exception as e:
+            # Keeps serving other requests
+            return {"error": "JaktError", "args": [f"{type(e).__name__}: {e}"]}
+
+        return {"result": result}
+
+    def listen(self) -> socket.socket:
+        """
+        Binds the socket, replacing a socket left behind by a daemon that is gone
+        """
+        if os.path.exists(self.path):
+            if Client.reachable(self.path):
+                raise JaktActiveError("jakt serve is already running.")
+            os.remove(self.path)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        sock.listen()
+
+        return sock
+
+    def serve(self) -> None:
+        """
+        Answers requests until interrupted
+        """
+        import selectors
+
+        sock = self.listen()
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+        buffers = {}
+
+        try:
+            while True:
+                for key, _ in selector.select():
+                    if key.fileobj is sock:
+                        conn, _ = sock.accept()
+                        selector.register(conn, selectors.EVENT_READ)
+                        buffers[conn] = b""
+                        continue
+
+                    conn = key.fileobj
+                    try:
+                        data = conn.recv(65536)
+                    except OSError:
+                        data = b""
+
+                    if not data:
+                        selector.unregister(conn)
+                        conn.close()
+                        del buffers[conn]
+                        continue
+
+                    buffers[conn] += data
+                    while b"\n" in buffers[conn]:
+                        line, buffers[conn] = buffers[conn].split(b"\n", 1)
+                        self.reply(conn, line)
+        finally:
+            selector.close()
+            sock.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def reply(self, conn: socket.socket, line: bytes) -> None:
+        try:
+            answer = self.handle(loads(line))
+            message = dumps(answer)
+        except (ValueError, TypeError) as e:
+            message = dumps({"error": "JaktError", "args": [str(e)]})
+
+        try:
+            conn.sendall(message)
+        except OSError:
+            pass
+
+
+## Client
+class Client:
+    """
+    Stand-in for jakt that forwards calls to a running daemon.
+    """
+
+    def __init__(self, dataPath: str = None, sock: socket.socket = None) -> None:
+        self.dataPath = dataPath
+        self.sock = sock
+        self.reader = sock.makefile("rb") if sock else None
+        self._local = None
+
+    @staticmethod
+    def reachable(path: str) -> bool:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(path)
+            return True
+        except OSError:
+            return False
+
+    @property
+    def local(self) -> jakt:
+        """
+        jakt reading the files directly, created on first use
+        """
+        if self._local is None:
+            self._local = jakt(self.dataPath)
+
+        return self._local
+
+    def call(self, method: str, *args, **kwargs):
+        if self.sock is not None:
+            try:
+                self.sock.sendall(
+                    dumps({"method": method, "args": args, "kwargs": kwargs})
+                )
+                sent = True
+            except OSError:
+                sent = False
+
+            line = b""
+            if sent:
+                try:
+                    line = self.reader.readline()
+                except OSError:
+                    pass
+
+            if line:
+                return self.answer(loads(line))
+
+            # The daemon has gone away
+            self.close()
+
+            if sent and method not in READING:
+                raise JaktError(
+                    f"jakt serve stopped while running {method}, "
+                    "it may or may not have been done."
+                )
+
+        return getattr(self.local, method)(*args, **kwargs)
+
+    def answer(self, answer: dict):
+        if "error" in answer:
+            error = getattr(exceptions, answer["error"], JaktError)
+            raise error(*answer["args"])
+
+        return answer["result"]
+
+    def close(self) -> None:
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+            self.sock = None
+
+    def __getattr__(self, name: str):
+        if name in SERVED:
+            return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+        return getattr(self.local, name)
+
+
+def connect(dataPath: str = None) -> Client:
+    """
+    Returns a Client for the daemon serving dataPath, or None if it is not running
+    """
+    path = socketPath(dataPath)
+    if not os.path.exists(path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+
+    return Client(dataPath, sock)
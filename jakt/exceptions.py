@@ -18,3 +18,16 @@ class JaktPathError(JaktError):
 
 class JaktInputError(JaktError):
     pass
+
+
+class JaktOverlapError(JaktError):
+    pass
+
+
+class JaktRemoteError(JaktError):
+    pass
+
+
+class JaktCorruptError(JaktError):
+    def __init__(self, path):
+        self.path = path
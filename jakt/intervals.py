@@ -0,0 +1,133 @@
+import json
+import heapq
+from bisect import bisect_left
+
+from .timeslot import timeslot, TimeslotTable
+from .atomic import atomicWrite
+from .exceptions import *
+
+
+class IntervalIndex:
+    """
+    Sorted sweep structure over the [start, end) ranges of a TimeslotTable.
+
+    Rows are sorted by start and the largest end up to every row is kept
+    alongside. Timeslots overlapping a range are found with a binary
+    search on the starts, walking back only while an earlier row can
+    still reach into the range.
+    """
+
+    def __init__(self, table: TimeslotTable) -> None:
+        self.table = table
+
+        rows = range(len(table))
+        starts = table.starts
+        if any(starts[i] > starts[i + 1] for i in range(len(starts) - 1)):
+            rows = sorted(rows, key=starts.__getitem__)
+        self.rows = list(rows)
+
+        self.starts = [starts[i] for i in self.rows]
+        self.ends = [table.ends[i] for i in self.rows]
+
+        self.reach = []
+        furthest = None
+        for end in self.ends:
+            furthest = end if furthest is None else max(furthest, end)
+            self.reach.append(furthest)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def timeslot(self, i: int) -> timeslot:
+        row = self.rows[i]
+        table = self.table
+        return timeslot(
+            table.ids[row], table.starts[row], table.ends[row], table.projects[row], table.tags[row]
+        )
+
+    def overlapping(self, start: int, end: int) -> list[timeslot]:
+        """
+        Returns the timeslots overlapping [start, end), sorted by start
+        """
+        found = []
+        i = bisect_left(self.starts, end) - 1
+        while i >= 0 and self.reach[i] > start:
+            if self.ends[i] > start:
+                found.append(self.timeslot(i))
+            i -= 1
+
+        found.reverse()
+        return found
+
+    def sweep(self) -> tuple:
+        """
+        Finds every overlap and gap in one pass over the starts.
+
+        Returns (overlaps, gaps). overlaps lists (first, second, seconds)
+        for every pair of timeslots overlapping, gaps lists (end, start)
+        for every stretch no timeslot covers between the first and the last.
+        """
+        overlaps = []
+        gaps = []
+
+        # (end, position) of the timeslots still running at the current start
+        active = []
+        furthest = None
+        for i, (start, end) in enumerate(zip(self.starts, self.ends)):
+            while active and active[0][0] <= start:
+                heapq.heappop(active)
+
+            if furthest is not None and furthest < start:
+                gaps.append((furthest, start))
+
+            if active:
+                ts = self.timeslot(i)
+                for otherEnd, j in active:
+                    overlaps.append((self.timeslot(j), ts, min(end, otherEnd) - start))
+
+            heapq.heappush(active, (end, i))
+            furthest = end if furthest is None else max(furthest, end)
+
+        return overlaps, gaps
+
+
+class Intervals:
+    """
+    Bound on the length of stored timeslots.
+
+    A timeslot overlapping [start, end) must start in
+    [start - longest, end), so overlap checks only read that window from
+    storage, see jakt.overlaps(). Removing a timeslot leaves the bound as
+    it is, it is tightened the next time the index is rebuilt.
+
+    Stored as JSON together with the storage version it matches, like the
+    Catalog.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.version = None
+        self.longest = 0
+
+        try:
+            with open(self.path, "r") as f:
+                stored = json.load(f)
+            self.version = stored["version"]
+            self.longest = stored["longest"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def save(self) -> None:
+        atomicWrite(self.path, json.dumps({"version": self.version, "longest": self.longest}))
+
+    def rebuild(self, timeslots, version) -> None:
+        self.longest = 0
+        self.update(added=timeslots, version=version)
+
+    def update(self, added=(), removed=(), version=None) -> None:
+        for ts in added:
+            if ts.end is not None:
+                self.longest = max(self.longest, ts.end - ts.start)
+
+        self.version = version
+        self.save()
@@ -0,0 +1,328 @@
+import os
+import json
+from bisect import bisect_left, bisect_right
+
+from .timeslot import timeslot, TimeslotTable
+from . import binary
+from .atomic import atomicWrite, appendLines
+from .exceptions import *
+
+
+def statKey(path: str) -> tuple:
+    """
+    Returns the mtime, size and inode of path, or None if it does not exist
+    """
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except FileNotFoundError:
+        return None
+
+
+class Journal:
+    """
+    Append-only storage for timeslots.
+
+    Timeslots are kept in a snapshot file holding a JSON list and a journal
+    file with one JSON record per line. Adding a timeslot appends a single
+    line, edits append a replacement record and deletes append a tombstone.
+    compact() folds the journal back into the snapshot.
+
+    The snapshot is replaced atomically and journal lines are flushed to
+    disk as they are appended. Replaying the journal is idempotent, so a
+    journal left behind by an interrupted compact() does no harm.
+
+    Parsed timeslots are cached and only read again when the mtime, size
+    or inode of the files change. Changes made through the journal update
+    the cache in place. A list of the cached timeslots sorted by start is
+    kept alongside, so date ranges are found with a binary search.
+
+    If pathBinary is given, the timeslots are also kept in a binary
+    snapshot, see binary.py, written after every change and checked
+    against the files. A new process loads it instead of parsing JSON,
+    and table() reads its columns without creating timeslots.
+    """
+
+    def __init__(
+        self, pathSnapshot: str, pathJournal: str, pathBinary: str = None
+    ) -> None:
+        self.pathSnapshot = pathSnapshot
+        self.pathJournal = pathJournal
+        self.pathBinary = pathBinary
+
+        self.cache = None
+        self.cacheKey = None
+        self.positions = {}
+
+        # Cached timeslots sorted by start, built on the first range query
+        self.starts = None
+        self.byStart = None
+
+    def fileKey(self) -> tuple:
+        """
+        Returns a key that changes whenever one of the files changes
+        """
+        return (statKey(self.pathSnapshot), statKey(self.pathJournal))
+
+    def load(self) -> list[timeslot]:
+        """
+        Returns all timeslots, snapshot first with the journal replayed on top
+        """
+        self.refresh()
+
+        return list(self.cache)
+
+    def refresh(self) -> None:
+        """
+        Parses the files again if they changed since they were cached
+        """
+        key = self.fileKey()
+        if self.cache is None or key != self.cacheKey:
+            snapshot = self.binary(key)
+            if snapshot is not None:
+                self.cache = snapshot.timeslots()
+            else:
+                self.cache = self.parse()
+                self.writeBinary(key)
+
+            self.cacheKey = key
+            self.index()
+            self.byStart = None
+
+    def binary(self, key: tuple):
+        """
+        Returns the binary snapshot if it matches the files with key, or None
+        """
+        if self.pathBinary is None:
+            return None
+
+        return binary.BinarySnapshot.open(self.pathBinary, key)
+
+    def writeBinary(self, key: tuple) -> None:
+        if self.pathBinary is None:
+            return
+
+        try:
+            binary.write(self.pathBinary, self.cache, key)
+        except JaktPathError:
+            # Only a cache, the JSON files are parsed instead
+            pass
+
+    def table(self, from_: int = None, to: int = None) -> TimeslotTable:
+        """
+        Returns completed timeslots starting in [from_, to) as a table sorted by start
+        """
+        key = self.fileKey()
+        if self.cache is None or key != self.cacheKey:
+            snapshot = self.binary(key)
+            if snapshot is not None:
+                return snapshot.table(from_, to)
+
+        return TimeslotTable.fromTimeslots(self.range(from_, to))
+
+    def index(self) -> None:
+        self.positions = {ts.id: i for i, ts in enumerate(self.cache)}
+
+    def range(self, from_: int = None, to: int = None) -> list[timeslot]:
+        """
+        Returns timeslots starting in [from_, to) sorted by start
+        """
+        self.refresh()
+
+        if self.byStart is None:
+            self.byStart = sorted(self.cache, key=lambda ts: ts.start)
+            self.starts = [ts.start for ts in self.byStart]
+
+        lo = 0
+        hi = len(self.starts)
+        if from_ is not None:
+            lo = bisect_left(self.starts, from_)
+        if to is not None:
+            hi = bisect_left(self.starts, to, lo)
+
+        return self.byStart[lo:hi]
+
+    def indexStart(self, ts: timeslot) -> None:
+        if self.byStart is None:
+            return
+
+        i = bisect_right(self.starts, ts.start)
+        self.starts.insert(i, ts.start)
+        self.byStart.insert(i, ts)
+
+    def unindexStart(self, ts: timeslot) -> None:
+        if self.byStart is None:
+            return
+
+        i = bisect_left(self.starts, ts.start)
+        while self.byStart[i] is not ts:
+            i += 1
+
+        del self.starts[i]
+        del self.byStart[i]
+
+    def parse(self) -> list[timeslot]:
+        timeslots = []
+        positions = {}
+
+        for obj in self.readSnapshot():
+            positions[obj["id"]] = len(timeslots)
+            timeslots.append(obj)
+
+        for record in self.readJournal():
+            if record["op"] == "add":
+                i = positions.get(record["ts"]["id"])
+                if i is not None:
+                    # Already folded into the snapshot
+                    timeslots[i] = record["ts"]
+                    continue
+                positions[record["ts"]["id"]] = len(timeslots)
+                timeslots.append(record["ts"])
+
+            elif record["op"] == "edit":
+                i = positions.pop(record["id"], None)
+                if i is None:
+                    continue
+                timeslots[i] = record["ts"]
+                positions[record["ts"]["id"]] = i
+
+            elif record["op"] == "del":
+                i = positions.pop(record["id"], None)
+                if i is not None:
+                    timeslots[i] = None
+
+        return [timeslot.from_json(obj) for obj in timeslots if obj is not None]
+
+    def readSnapshot(self) -> list[dict]:
+        """
+        Returns the timeslots of the snapshot as dicts.
+
+        A snapshot that can not be parsed raises JaktCorruptError instead of
+        reading as empty, so the next write does not wipe the history.
+        """
+        try:
+            with open(self.pathSnapshot, "r") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        except OSError:
+            raise JaktPathError(self.pathSnapshot)
+
+        # Created empty on first time setup
+        if not data.strip():
+            return []
+
+        try:
+            return json.loads(data)
+        except ValueError:
+            raise JaktCorruptError(self.pathSnapshot)
+
+    def readJournal(self):
+        """
+        Yields the records of the journal in the order they were written
+        """
+        try:
+            with open(self.pathJournal, "r") as f:
+                for line in f:
+                    # A partially written last line is ignored
+                    if not line.endswith("\n"):
+                        break
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        raise JaktCorruptError(self.pathJournal)
+        except FileNotFoundError:
+            return
+        except OSError:
+            raise JaktPathError(self.pathJournal)
+
+    def writeRecords(self, records: list[dict]) -> None:
+        appendLines(self.pathJournal, "".join(json.dumps(r) + "\n" for r in records))
+
+    ## Changes
+    def append(self, ts: timeslot) -> None:
+        self.extend([ts])
+
+    def extend(self, timeslots: list[timeslot]) -> None:
+        """
+        Appends all timeslots with a single write
+        """
+        cached = self.isCached()
+        self.writeRecords([{"op": "add", "ts": ts.toDict()} for ts in timeslots])
+
+        if cached:
+            for ts in timeslots:
+                self.positions[ts.id] = len(self.cache)
+                self.cache.append(ts)
+                self.indexStart(ts)
+            self.cacheKey = self.fileKey()
+            self.writeBinary(self.cacheKey)
+
+    def replace(self, queryId: str, ts: timeslot) -> None:
+        self.replaceMany([(queryId, ts)])
+
+    def replaceMany(self, changes: list[tuple]) -> None:
+        """
+        Replaces the timeslot of each (queryId, ts) in changes with a single write
+        """
+        cached = self.isCached()
+        self.writeRecords(
+            [{"op": "edit", "id": queryId, "ts": ts.toDict()} for queryId, ts in changes]
+        )
+
+        if cached:
+            for queryId, ts in changes:
+                i = self.positions.pop(queryId, None)
+                if i is not None:
+                    self.unindexStart(self.cache[i])
+                    self.cache[i] = ts
+                    self.positions[ts.id] = i
+                    self.indexStart(ts)
+            self.cacheKey = self.fileKey()
+            self.writeBinary(self.cacheKey)
+
+    def remove(self, queryId: str) -> None:
+        cached = self.isCached()
+        self.writeRecords([{"op": "del", "id": queryId}])
+
+        if cached:
+            i = self.positions.pop(queryId, None)
+            if i is not None:
+                self.unindexStart(self.cache[i])
+                del self.cache[i]
+                self.index()
+            self.cacheKey = self.fileKey()
+            self.writeBinary(self.cacheKey)
+
+    def isCached(self) -> bool:
+        """
+        Returns True if the cache matches the files on disk
+        """
+        return self.cache is not None and self.fileKey() == self.cacheKey
+
+    def write(self, timeslots: list[timeslot]) -> None:
+        """
+        Replaces the snapshot with timeslots and empties the journal
+        """
+        atomicWrite(self.pathSnapshot, json.dumps([ts.toDict() for ts in timeslots]))
+
+        if os.path.exists(self.pathJournal):
+            os.remove(self.pathJournal)
+
+        self.cache = list(timeslots)
+        self.cacheKey = self.fileKey()
+        self.index()
+        self.byStart = None
+        self.writeBinary(self.cacheKey)
+
+    def compact(self) -> int:
+        """
+        Folds the journal into the snapshot.
+
+        Returns the number of journal records that were folded.
+        """
+        records = sum(1 for _ in self.readJournal())
+        if records:
+            self.write(self.load())
+
+        return records
@@ -0,0 +1,96 @@
+"""
+Merging the timeslots of another data directory, see jakt.merge().
+
+Both sides are read in order of start from Storage.ordered() and walked
+together, like a merge join, so timeslots
+that are the same record line up without comparing every pair. Two
+timeslots are the same record if they have the same ID, or the same
+start, end and project. A record that differs between the sides, in its
+tags or under the same ID, is a conflict and resolved by the policy:
+
+    "ours"    keep the timeslot of this directory
+    "theirs"  take the timeslot of the other directory, under our ID
+    "both"    keep both, the other one under a new ID
+"""
+import heapq
+from operator import attrgetter
+
+from .timeslot import timeslot
+from .exceptions import *
+
+
+POLICIES = ("ours", "theirs", "both")
+
+
+def content(ts: timeslot) -> tuple:
+    return (ts.start, ts.end, ts.project, tuple(ts.tags))
+
+
+def mergeJoin(ours: list[timeslot], theirs: list[timeslot], policy: str = "ours") -> tuple:
+    """
+    Merges two lists of timeslots sorted by start in O(n + m).
+
+    Returns (merged, counts). merged is sorted by start, timeslots to be
+    kept under a new ID have None as ID. counts holds the number of
+    timeslots "added", "replaced" and "skipped" as already there, and the
+    number of "conflicts".
+    """
+    if policy not in POLICIES:
+        raise JaktInputError(f"Unknown policy '{policy}'.")
+
+    byId = {ts.id: ts for ts in ours}
+
+    counts = {"added": 0, "replaced": 0, "skipped": 0, "conflicts": 0}
+
+    # Their version of our timeslots, by our ID
+    replaced = {}
+    # Their timeslots not matching any of ours, in order of start
+    added = []
+
+    i = 0
+    for ts in theirs:
+        # Our timeslots starting before ts are passed
+        while i < len(ours) and ours[i].start < ts.start:
+            i += 1
+
+        # Our timeslots with the same start, end and project
+        candidates = []
+        j = i
+        while j < len(ours) and ours[j].start == ts.start:
+            if ours[j].end == ts.end and ours[j].project == ts.project:
+                candidates.append(ours[j])
+            j += 1
+
+        mine = byId.get(ts.id)
+        if mine is None and candidates:
+            mine = candidates[0]
+
+        if mine is None:
+            added.append(ts)
+            counts["added"] += 1
+            continue
+
+        # Already there, maybe kept under another ID by an earlier merge
+        if any(content(other) == content(ts) for other in [mine] + candidates):
+            counts["skipped"] += 1
+            continue
+
+        counts["conflicts"] += 1
+        if policy == "theirs":
+            replaced[mine.id] = timeslot(mine.id, ts.start, ts.end, ts.project, ts.tags)
+            counts["replaced"] += 1
+        elif policy == "both":
+            added.append(timeslot(None, ts.start, ts.end, ts.project, ts.tags))
+            counts["added"] += 1
+
+    # Replaced timeslots whose start changed are taken out and merged back in
+    kept = []
+    moved = []
+    for ts in ours:
+        new = replaced.get(ts.id, ts)
+        (kept if new.start == ts.start else moved).append(new)
+    moved.sort(key=attrgetter("start"))
+
+    merged = list(heapq.merge(kept, moved, added, key=attrgetter("start")))
+
+    return merged, counts
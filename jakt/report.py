@@ -1,47 +1,56 @@
-from datetime import datetime, timedelta
-import click
+from datetime import date, datetime, timedelta
 
+from .timeslot import TimeslotTable
+from .exceptions import *
 
-class JaktReport:
-    def __init__(self, jkt):
-        # self.categories = jkt.getCategories()
-        projects = jkt.getProjects()
 
-        self.data = []
-        for i in range(len(projects)):
-            project = projects[i]
+class JaktReport:
+    def __init__(self, jkt, from_=False, to=False):
+        self.data = self.format(self.totals(jkt.getTable(from_=from_, to=to)))
 
-            projectDuration = timedelta(0)
+    @staticmethod
+    def totals(table: TimeslotTable) -> dict:
+        """
+        Returns project and project x tag totals in seconds, filled in one scan
+        """
+        projects = {}
 
-            tags = jkt.getTags(project=project)
+        for project, tsTags, seconds in zip(
+            table.projects, table.tags, table.durations()
+        ):
+            proj = projects.get(project)
+            if proj is None:
+                proj = projects[project] = {"time": 0, "tags": {}}
 
-            for j in range(len(tags)):
-                timeslots = jkt.getTimeslots(project=project, tag=tags[j])
+            proj["time"] += seconds
 
-                tagDuration = timedelta(0)
-                for ts in timeslots:
-                    tagDuration += ts.duration
+            tags = proj["tags"]
+            for tag in dict.fromkeys(tsTags):
+                tags[tag] = tags.get(tag, 0) + seconds
 
-                tagobj = {"tag": tags[j], "timeslots": timeslots, "time": tagDuration}
+        return projects
 
-                tags[j] = tagobj
+    @staticmethod
+    def format(projects: dict) -> list[dict]:
+        """
+        Returns the totals of totals() as the list of projects in data
+        """
+        data = []
+        for project, proj in projects.items():
+            tags = [{"tag": tag, "time": time} for tag, time in proj["tags"].items()]
 
-            # Calculate project duration
-            timeslots = jkt.getTimeslots(project=project)
-            for ts in timeslots:
-                projectDuration += ts.duration
+            projectObj = {"project": project, "tags": tags, "time": proj["time"]}
 
-            projectObj = {"project": project, "tags": tags, "time": projectDuration}
+            data.append(projectObj)
 
-            self.data.append(projectObj)
+        return data
 
     def __str__(self):
         return f"{self.data}"
 
-    def hrDuration(self, td):
-        hrs,rem = divmod(td.seconds, 3600)
+    def hrDuration(self, seconds: int):
+        hrs,rem = divmod(seconds, 3600)
         mns,scs = divmod(rem, 60)
-        hrs += 24*td.days
         return f"{int(hrs):02}:{int(mns):02}:{int(scs):02}"
 
     def getProjectReport(self, project: str = "") -> list[dict]:
@@ -68,6 +77,7 @@ class JaktReport:
             raise JaktInputError
 
         # Find project that matches given project string
+        selectedProject = {"tags": []}
         for proj in self.data:
             if proj["project"] == project:
                 selectedProject = proj
@@ -81,3 +91,106 @@ class JaktReport:
             report.append(tag_report)
 
         return report
+
+
+class PeriodReport:
+    """
+    Project and tag totals per day, week or month, read from the rollups.
+    """
+
+    def __init__(self, jkt, by: str = "week", from_=False, to=False):
+        if by not in ("day", "week", "month"):
+            raise JaktInputError(f"Unknown period '{by}'.")
+
+        rollups = jkt.rollups
+
+        first, last = rollups.bounds()
+        if from_:
+            first = from_.date() if isinstance(from_, datetime) else from_
+        if to:
+            # to is exclusive, the day holding the moment before it is the last
+            if isinstance(to, datetime):
+                last = (to - timedelta(seconds=1)).date()
+            else:
+                last = to - timedelta(days=1)
+
+        self.data = []
+        if first is None or last is None:
+            return
+
+        for start, end in self.periods(by, first, last):
+            projects = rollups.totals(max(start, first), min(end, last))
+            self.data.append(
+                {"period": self.label(by, start), "from": start, "to": end, "projects": projects}
+            )
+
+    def periods(self, by: str, first: date, last: date):
+        """
+        Yields (first day, last day) of every period overlapping first to last
+        """
+        if by == "day":
+            start = first
+        elif by == "week":
+            start = first - timedelta(days=first.weekday())
+        else:
+            start = first.replace(day=1)
+
+        while start <= last:
+            if by == "day":
+                following = start + timedelta(days=1)
+            elif by == "week":
+                following = start + timedelta(days=7)
+            else:
+                following = (start + timedelta(days=32)).replace(day=1)
+
+            yield start, following - timedelta(days=1)
+            start = following
+
+    def label(self, by: str, start: date) -> str:
+        if by == "day":
+            return start.strftime("%d-%m-%y")
+
+        if by == "week":
+            year, week, _ = start.isocalendar()
+            return f"Week {week} {year}"
+
+        return start.strftime("%B %Y")
+
+    def hrDuration(self, seconds: int):
+        hrs,rem = divmod(seconds, 3600)
+        mns,scs = divmod(rem, 60)
+        return f"{int(hrs):02}:{int(mns):02}:{int(scs):02}"
+
+    def getPeriodReport(self, project: str = "", tag: str = "") -> list[dict]:
+        """
+        Returns a report per period with project and tag totals
+        """
+        report = []
+        for period in self.data:
+            projects = []
+            for name, proj in period["projects"].items():
+                if project and name != project:
+                    continue
+
+                tags = [
+                    {"tag": tg, "time": self.hrDuration(time)}
+                    for tg, time in proj["tags"].items()
+                    if not tag or tg == tag
+                ]
+                if tag and not tags:
+                    continue
+
+                projects.append(
+                    {"project": name, "time": self.hrDuration(proj["time"]), "tags": tags}
+                )
+
+            report.append(
+                {
+                    "period": period["period"],
+                    "from": period["from"],
+                    "to": period["to"],
+                    "projects": projects,
+                }
+            )
+
+        return report
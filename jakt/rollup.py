@@ -0,0 +1,219 @@
+import os
+import json
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+
+from .timeslot import timeslot
+from .atomic import atomicWrite
+from .exceptions import *
+
+
+class Rollups:
+    """
+    Time per day for every project and every tag of a project.
+
+    Timeslots are split at local midnight and their seconds added to each
+    day they cover. The totals are updated with every change, like the
+    Catalog.
+
+    Days are stored in one JSON file per month in the directory path, so
+    a change only rewrites the months it touches. version.json holds the
+    storage version the files match and is written last.
+
+    totals.json holds the totals of every month, so whole months in a
+    range are read from it and only the days of the months at either end
+    are summed. Only the projects and tags logged in a range are touched.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.pathVersion = os.path.join(path, "version.json")
+        self.pathTotals = os.path.join(path, "totals.json")
+        self.version = None
+
+        # Days of the months read so far, by month
+        self.months = {}
+        self.changed = set()
+
+        # Totals of every month with logged time, by month
+        self.monthTotals = {}
+        self.monthList = []
+
+        try:
+            with open(self.pathVersion, "r") as f:
+                self.version = json.load(f)["version"]
+            with open(self.pathTotals, "r") as f:
+                self.monthTotals = json.load(f)
+            self.monthList = sorted(self.monthTotals)
+        except (OSError, ValueError, KeyError, TypeError):
+            # Rebuilt on first use
+            self.version = None
+
+    ## Files
+    def month(self, key: str) -> dict:
+        """
+        Returns the days of month key ("YYYY-MM"), read on first use
+        """
+        if key not in self.months:
+            try:
+                with open(os.path.join(self.path, f"{key}.json"), "r") as f:
+                    self.months[key] = json.load(f)
+            except (OSError, ValueError):
+                self.months[key] = {}
+
+        return self.months[key]
+
+    def loadAll(self) -> None:
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return
+
+        for name in names:
+            if name.endswith(".json") and name not in ("version.json", "totals.json"):
+                self.month(name[:-5])
+
+    def save(self) -> None:
+        """
+        Writes the months changed since the last save, then the version
+        """
+        os.makedirs(self.path, exist_ok=True)
+
+        for key in self.changed:
+            path = os.path.join(self.path, f"{key}.json")
+            if self.months[key]:
+                atomicWrite(path, json.dumps(self.months[key]))
+                self.monthTotals[key] = addTotals({}, *self.months[key].values())
+            else:
+                if os.path.exists(path):
+                    os.remove(path)
+                self.monthTotals.pop(key, None)
+        self.changed = set()
+        self.monthList = sorted(self.monthTotals)
+
+        atomicWrite(self.pathTotals, json.dumps(self.monthTotals))
+        atomicWrite(self.pathVersion, json.dumps({"version": self.version}))
+
+    def rebuild(self, timeslots, version) -> None:
+        self.loadAll()
+        self.changed = set(self.months)
+        for days in self.months.values():
+            days.clear()
+
+        for ts in timeslots:
+            self.add(ts, 1)
+
+        self.version = version
+        self.save()
+
+    def update(self, added=(), removed=(), version=None) -> None:
+        for ts in removed:
+            self.add(ts, -1)
+
+        for ts in added:
+            self.add(ts, 1)
+
+        self.version = version
+        self.save()
+
+    def add(self, ts: timeslot, sign: int) -> None:
+        """
+        Adds (sign=1) or subtracts (sign=-1) the time of ts to the days it covers
+        """
+        if not ts.end:
+            return
+
+        for day, seconds in self.split(ts.start, ts.end):
+            days = self.month(day[:7])
+            self.changed.add(day[:7])
+
+            projects = days.setdefault(day, {})
+            proj = projects.setdefault(ts.project, {"time": 0, "tags": {}})
+
+            proj["time"] += sign * seconds
+            for tag in dict.fromkeys(ts.tags):
+                proj["tags"][tag] = proj["tags"].get(tag, 0) + sign * seconds
+                if proj["tags"][tag] <= 0:
+                    del proj["tags"][tag]
+
+            if proj["time"] <= 0:
+                del projects[ts.project]
+            if not projects:
+                del days[day]
+
+    def split(self, start: int, end: int):
+        """
+        Yields (day, seconds) for every local day the interval [start, end) covers
+        """
+        cursor = start
+        while cursor < end:
+            day = datetime.fromtimestamp(cursor).date()
+            midnight = datetime.combine(day + timedelta(days=1), datetime.min.time())
+            until = min(end, int(midnight.timestamp()))
+
+            yield day.isoformat(), until - cursor
+            cursor = until
+
+    ## Totals
+    def bounds(self) -> tuple:
+        """
+        Returns the first and last day with logged time, or None if there is none
+        """
+        if not self.monthList:
+            return None, None
+
+        first = min(self.month(self.monthList[0]))
+        last = max(self.month(self.monthList[-1]))
+
+        return date.fromisoformat(first), date.fromisoformat(last)
+
+    def totals(self, first: date, last: date) -> dict:
+        """
+        Returns seconds per project and per tag for the days first to last, inclusive.
+
+        The result maps each project to {"time": seconds, "tags": {tag: seconds}}.
+        """
+        lo = bisect_left(self.monthList, first.isoformat()[:7])
+        hi = bisect_right(self.monthList, last.isoformat()[:7])
+
+        firstDay = first.isoformat()
+        lastDay = last.isoformat()
+
+        totals = {}
+        for key in self.monthList[lo:hi]:
+            start = date.fromisoformat(f"{key}-01")
+            end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+            if first <= start and end <= last:
+                addTotals(totals, self.monthTotals[key])
+                continue
+
+            addTotals(
+                totals,
+                *(
+                    projects
+                    for day, projects in self.month(key).items()
+                    if firstDay <= day <= lastDay
+                ),
+            )
+
+        return totals
+
+
+def addTotals(totals: dict, *others: dict) -> dict:
+    """
+    Adds the project and tag totals of others to totals and returns it
+    """
+    for other in others:
+        for project, proj in other.items():
+            total = totals.get(project)
+            if total is None:
+                total = totals[project] = {"time": 0, "tags": {}}
+
+            total["time"] += proj["time"]
+
+            tags = total["tags"]
+            for tag, seconds in proj["tags"].items():
+                tags[tag] = tags.get(tag, 0) + seconds
+
+    return totals
@@ -0,0 +1,861 @@
+import os
+import json
+from time import gmtime
+from datetime import datetime
+
+from .timeslot import timeslot, TimeslotTable
+from .journal import Journal, statKey
+from .atomic import atomicWrite, appendLines
+from .exceptions import *
+
+
+class Storage:
+    """
+    Interface shared by all timeslot storage backends.
+    """
+
+    def query(self, from_=None, to=None, project=None, tag=None) -> list[timeslot]:
+        """
+        Returns all timeslots matching the given filters in the order they were added.
+
+        If from_ or to is given only timeslots starting in [from_, to) are
+        returned, sorted by start.
+        """
+        raise NotImplementedError
+
+    def iterate(self, from_=None, to=None, project=None, tag=None):
+        """
+        Yields the timeslots query() would return
+        """
+        yield from self.query(from_=from_, to=to, project=project, tag=tag)
+
+    def ordered(self):
+        """
+        Yields all timeslots sorted by start
+        """
+        yield from sorted(self.iterate(), key=lambda ts: ts.start)
+
+    def table(self, from_=None, to=None) -> TimeslotTable:
+        """
+        Returns completed timeslots starting in [from_, to) as a table
+        """
+        return TimeslotTable.fromTimeslots(self.iterate(from_=from_, to=to))
+
+    def get(self, queryId: str) -> timeslot:
+        """
+        Returns timeslot with id=queryId, or None if there is none
+        """
+        raise NotImplementedError
+
+    def has(self, queryId: str) -> bool:
+        """
+        Returns True if a timeslot with id=queryId is stored
+        """
+        return self.get(queryId) is not None
+
+    def used(self, IDs) -> set:
+        """
+        Returns the IDs of IDs that a stored timeslot has
+        """
+        return {ID for ID in IDs if self.has(ID)}
+
+    def projects(self) -> list[str]:
+        raise NotImplementedError
+
+    def tags(self, project: str = None) -> list[str]:
+        raise NotImplementedError
+
+    def append(self, ts: timeslot) -> None:
+        raise NotImplementedError
+
+    def extend(self, timeslots: list[timeslot]) -> None:
+        """
+        Appends all timeslots as one change
+        """
+        for ts in timeslots:
+            self.append(ts)
+
+    def replace(self, queryId: str, ts: timeslot) -> None:
+        raise NotImplementedError
+
+    def replaceMany(self, changes: list[tuple]) -> None:
+        """
+        Replaces the timeslot of each (queryId, ts) in changes as one change
+        """
+        for queryId, ts in changes:
+            self.replace(queryId, ts)
+
+    def remove(self, queryId: str) -> None:
+        raise NotImplementedError
+
+    def write(self, timeslots: list[timeslot]) -> None:
+        """
+        Replaces all stored timeslots
+        """
+        raise NotImplementedError
+
+    def compact(self) -> int:
+        return 0
+
+    def version(self) -> list:
+        """
+        Returns a JSON serializable value that changes whenever the stored data changes
+        """
+        raise NotImplementedError
+
+    def stamps(self) -> dict:
+        """
+        Returns a JSON serializable value per shard key, see shardKey, that
+        changes whenever the timeslots of that shard change. None if the
+        backend can not tell shards apart.
+        """
+        return None
+
+
+def shardKey(start: int) -> str:
+    """
+    Returns the key of the shard holding timeslots starting at start, one per UTC month
+    """
+    t = gmtime(start)
+    return f"{t.tm_year:04}-{t.tm_mon:02}"
+
+
+class IdIndex:
+    """
+    Map from timeslot id to the key of the shard holding it.
+
+    Stored as an append-only log of [id, key] pairs, key is null once the
+    id is removed, and read in full on first use. The log is rewritten
+    when it holds many more lines than ids.
+
+    Entries for added timeslots are written before the timeslots and
+    entries for removed ones after, so every stored id is in the map. A
+    key can be stale after an interrupted change and is checked by
+    JsonStorage.find.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.ids = None
+        self.lines = 0
+        self.key = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> dict:
+        key = statKey(self.path)
+        if self.ids is None or key != self.key:
+            self.ids = {}
+            self.lines = 0
+
+            try:
+                with open(self.path, "r") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                data = ""
+            except OSError:
+                raise JaktPathError(self.path)
+
+            # A partially written last line is ignored
+            data = data[: data.rfind("\n") + 1]
+            if data:
+                try:
+                    pairs = json.loads("[" + data[:-1].replace("\n", ",") + "]")
+                except ValueError:
+                    raise JaktCorruptError(self.path)
+
+                self.lines = len(pairs)
+                for ID, shard in pairs:
+                    if shard is None:
+                        self.ids.pop(ID, None)
+                    else:
+                        self.ids[ID] = shard
+
+            self.key = key
+
+        return self.ids
+
+    def get(self, queryId: str) -> str:
+        return self.load().get(queryId)
+
+    def set(self, pairs: list) -> None:
+        """
+        Records [id, key] pairs, key None removes id
+        """
+        if not pairs:
+            return
+
+        ids = self.load()
+        appendLines(self.path, "".join(json.dumps(pair) + "\n" for pair in pairs))
+
+        for ID, shard in pairs:
+            if shard is None:
+                ids.pop(ID, None)
+            else:
+                ids[ID] = shard
+        self.lines += len(pairs)
+        self.key = statKey(self.path)
+
+        if self.lines > 2 * len(ids) + 1000:
+            self.write(ids)
+
+    def write(self, ids: dict) -> None:
+        """
+        Replaces the map with ids
+        """
+        atomicWrite(
+            self.path,
+            "".join(json.dumps([ID, shard]) + "\n" for ID, shard in ids.items()),
+        )
+        self.ids = dict(ids)
+        self.lines = len(ids)
+        self.key = statKey(self.path)
+
+
+class JsonStorage(Storage):
+    """
+    Stores timeslots as JSON, partitioned in one shard per month.
+
+    Each shard is a snapshot with an append-only journal, see Journal. A
+    manifest lists the shards with their record count and time bounds.
+    Changes only touch the shards they affect and date ranges only open
+    the shards they overlap.
+
+    Timeslots stored in the older single file layout, given by
+    pathSnapshot and pathJournal, are moved to shards the first time.
+
+    Shards a change adds to are listed in the manifest before they are
+    written and shards are only dropped once they are empty, so an
+    interrupted change never hides or deletes stored timeslots.
+
+    An IdIndex maps ids to shards, so a lookup opens one shard at most.
+    """
+
+    def __init__(
+        self, pathShards: str, pathSnapshot: str = None, pathJournal: str = None
+    ) -> None:
+        self.pathShards = pathShards
+        self.pathManifest = os.path.join(pathShards, "manifest.json")
+
+        self.shards = {}
+        self.manifest = None
+        self.manifestKey = None
+        self.ids = IdIndex(os.path.join(pathShards, "ids.jsonl"))
+
+        if not os.path.exists(self.pathManifest):
+            self.migrate(pathSnapshot, pathJournal)
+        elif not self.ids.exists():
+            # Shards written before the id map existed
+            self.reindex()
+
+    def migrate(self, pathSnapshot: str = None, pathJournal: str = None) -> None:
+        """
+        Moves timeslots from the single file layout to shards
+        """
+        os.makedirs(self.pathShards, exist_ok=True)
+
+        legacy = None
+        timeslots = []
+        if pathSnapshot is not None:
+            legacy = Journal(pathSnapshot, pathJournal)
+            timeslots = legacy.load()
+
+        self.manifest = {"shards": {}}
+        self.write(timeslots)
+
+        # Old files are kept as a backup
+        if timeslots:
+            os.replace(legacy.pathSnapshot, legacy.pathSnapshot + ".bak")
+            if os.path.exists(legacy.pathJournal):
+                os.replace(legacy.pathJournal, legacy.pathJournal + ".bak")
+
+    ## Shards
+    def loadManifest(self) -> dict:
+        key = statKey(self.pathManifest)
+        if self.manifest is None or key != self.manifestKey:
+            try:
+                with open(self.pathManifest, "r") as f:
+                    self.manifest = json.load(f)
+            except OSError:
+                raise JaktPathError(self.pathManifest)
+            except ValueError:
+                raise JaktCorruptError(self.pathManifest)
+            self.manifestKey = key
+
+        return self.manifest
+
+    def saveManifest(self) -> None:
+        atomicWrite(self.pathManifest, json.dumps(self.manifest))
+        self.manifestKey = statKey(self.pathManifest)
+
+    def shard(self, key: str) -> Journal:
+        if key not in self.shards:
+            self.shards[key] = Journal(
+                os.path.join(self.pathShards, f"{key}.json"),
+                os.path.join(self.pathShards, f"{key}.jsonl"),
+                os.path.join(self.pathShards, f"{key}.bin"),
+            )
+
+        return self.shards[key]
+
+    def keys(self, from_: int = None, to: int = None) -> list[str]:
+        """
+        Returns keys of the shards that can hold timeslots starting in [from_, to)
+        """
+        keys = sorted(self.loadManifest()["shards"])
+
+        if from_ is not None:
+            first = shardKey(from_)
+            keys = [key for key in keys if key >= first]
+
+        if to is not None:
+            last = shardKey(to - 1)
+            keys = [key for key in keys if key <= last]
+
+        return keys
+
+    def find(self, queryId: str) -> str:
+        """
+        Returns key of the shard holding timeslot with id=queryId, or None
+        """
+        key = self.ids.get(queryId)
+        if key is None:
+            return None
+
+        if key in self.loadManifest()["shards"]:
+            shard = self.shard(key)
+            shard.refresh()
+            if queryId in shard.positions:
+                return key
+
+        # Stale after an interrupted change
+        for key in self.keys():
+            shard = self.shard(key)
+            shard.refresh()
+            if queryId in shard.positions:
+                return key
+
+        return None
+
+    def reindex(self) -> None:
+        """
+        Builds the id map from the shards
+        """
+        ids = {}
+        for key in self.keys():
+            shard = self.shard(key)
+            shard.refresh()
+            for ID in shard.positions:
+                ids[ID] = key
+
+        self.ids.write(ids)
+
+    def count(self, key: str, timeslots: list[timeslot], records: int) -> None:
+        """
+        Updates the manifest entry of shard key with records for each of timeslots
+        """
+        entry = self.manifest["shards"].setdefault(
+            key, {"records": 0, "first": None, "last": None}
+        )
+        entry["records"] += records * len(timeslots)
+
+        for ts in timeslots:
+            end = ts.end or ts.start
+            if entry["first"] is None or ts.start < entry["first"]:
+                entry["first"] = ts.start
+            if entry["last"] is None or end > entry["last"]:
+                entry["last"] = end
+
+    def drop(self, key: str) -> None:
+        """
+        Removes the files of shard key and its manifest entry if it holds no timeslots
+        """
+        shard = self.shard(key)
+        if shard.load():
+            # Counted wrong after an interrupted change, the shard is kept
+            self.manifest["shards"][key]["records"] = len(shard.cache)
+            return
+
+        for path in (shard.pathSnapshot, shard.pathJournal, shard.pathBinary):
+            if os.path.exists(path):
+                os.remove(path)
+
+        self.manifest["shards"].pop(key, None)
+        del self.shards[key]
+
+    ## Queries
+    def query(self, from_=None, to=None, project=None, tag=None) -> list[timeslot]:
+        return list(self.iterate(from_=from_, to=to, project=project, tag=tag))
+
+    def iterate(self, from_=None, to=None, project=None, tag=None):
+        """
+        Yields matching timeslots shard by shard, oldest shard first
+        """
+        from_ = timestamp(from_)
+        to = timestamp(to)
+
+        for key in self.keys(from_, to):
+            shard = self.shard(key)
+
+            if from_ or to:
+                timeslots = shard.range(from_, to)
+            else:
+                shard.refresh()
+                timeslots = shard.cache
+
+            for ts in timeslots:
+                # Filters by project if project is given
+                if project and ts.project != project:
+                    continue
+
+                # Filters by tags if tags are given
+                if tag and tag not in ts.tags:
+                    continue
+
+                yield ts
+
+    def ordered(self):
+        """
+        Yields the sorted timeslots of shard after shard, shards hold one month each
+        """
+        for key in self.keys():
+            yield from self.shard(key).range()
+
+    def table(self, from_=None, to=None) -> TimeslotTable:
+        """
+        Joins the tables of the shards, read from their binary snapshots if current
+        """
+        from_ = timestamp(from_)
+        to = timestamp(to)
+
+        table = TimeslotTable()
+        for key in self.keys(from_, to):
+            table.extend(self.shard(key).table(from_, to))
+
+        return table
+
+    def get(self, queryId: str) -> timeslot:
+        key = self.find(queryId)
+        if key is None:
+            return None
+
+        shard = self.shard(key)
+        return shard.cache[shard.positions[queryId]]
+
+    def has(self, queryId: str) -> bool:
+        return self.find(queryId) is not None
+
+    def used(self, IDs) -> set:
+        # Only ids in the map can be stored
+        ids = self.ids.load()
+        return {ID for ID in IDs if ID in ids and self.find(ID) is not None}
+
+    def projects(self) -> list[str]:
+        projects = {}
+        for ts in self.iterate():
+            projects[ts.project] = True
+
+        return list(projects)
+
+    def tags(self, project: str = None) -> list[str]:
+        tags = {}
+        for ts in self.iterate(project=project):
+            for tag in ts.tags:
+                tags[tag] = True
+
+        return list(tags)
+
+    ## Changes
+    def append(self, ts: timeslot) -> None:
+        self.extend([ts])
+
+    def extend(self, timeslots: list[timeslot]) -> None:
+        self.loadManifest()
+
+        groups = {}
+        for ts in timeslots:
+            groups.setdefault(shardKey(ts.start), []).append(ts)
+
+        for key, group in groups.items():
+            self.count(key, group, 1)
+        self.saveManifest()
+        self.ids.set([[ts.id, key] for key, group in groups.items() for ts in group])
+
+        for key, group in groups.items():
+            self.shard(key).extend(group)
+
+    def replace(self, queryId: str, ts: timeslot) -> None:
+        key = self.find(queryId)
+        if key is None:
+            return
+
+        newKey = shardKey(ts.start)
+        if newKey == key:
+            self.ids.set([[ts.id, key]] if ts.id != queryId else [])
+            self.shard(key).replace(queryId, ts)
+            self.count(key, [ts], 0)
+        else:
+            # Start moved to another month, added to the new shard first
+            self.count(newKey, [ts], 1)
+            self.saveManifest()
+            self.ids.set([[ts.id, newKey]])
+            self.shard(newKey).append(ts)
+
+            self.shard(key).remove(queryId)
+            self.manifest["shards"][key]["records"] -= 1
+
+            if self.manifest["shards"][key]["records"] <= 0:
+                self.drop(key)
+
+        if ts.id != queryId:
+            self.ids.set([[queryId, None]])
+
+        self.saveManifest()
+
+    def replaceMany(self, changes: list[tuple]) -> None:
+        """
+        Replaces the timeslots with one journal write per shard
+        """
+        groups = {}
+        for queryId, ts in changes:
+            key = self.find(queryId)
+            if key is None:
+                continue
+
+            if shardKey(ts.start) != key:
+                # Moves to another shard
+                self.replace(queryId, ts)
+            else:
+                groups.setdefault(key, []).append((queryId, ts))
+
+        renamed = [
+            (queryId, ts, key)
+            for key, group in groups.items()
+            for queryId, ts in group
+            if ts.id != queryId
+        ]
+        self.ids.set([[ts.id, key] for _, ts, key in renamed])
+
+        for key, group in groups.items():
+            self.shard(key).replaceMany(group)
+            self.count(key, [ts for _, ts in group], 0)
+
+        self.ids.set([[queryId, None] for queryId, _, _ in renamed])
+        self.saveManifest()
+
+    def remove(self, queryId: str) -> None:
+        key = self.find(queryId)
+        if key is None:
+            return
+
+        self.shard(key).remove(queryId)
+        self.manifest["shards"][key]["records"] -= 1
+        self.ids.set([[queryId, None]])
+
+        if self.manifest["shards"][key]["records"] <= 0:
+            self.drop(key)
+
+        self.saveManifest()
+
+    def write(self, timeslots: list[timeslot]) -> None:
+        groups = {}
+        for ts in timeslots:
+            groups.setdefault(shardKey(ts.start), []).append(ts)
+
+        self.loadManifest()
+
+        old = [key for key in self.manifest["shards"] if key not in groups]
+
+        # Lists old and new shards and ids until the new shards are written,
+        # so an interrupted write leaves no written shard out of the manifest
+        for key, group in groups.items():
+            self.count(key, group, 0)
+        self.saveManifest()
+
+        ids = {ts.id: key for key, group in groups.items() for ts in group}
+        self.ids.write({**self.ids.load(), **ids})
+
+        self.manifest["shards"] = {}
+        for key, group in groups.items():
+            self.shard(key).write(group)
+            self.count(key, group, 1)
+
+        self.saveManifest()
+        self.ids.write(ids)
+
+        # Shards left out of the manifest are unused
+        for key in old:
+            shard = self.shard(key)
+            for path in (shard.pathSnapshot, shard.pathJournal, shard.pathBinary):
+                if os.path.exists(path):
+                    os.remove(path)
+            del self.shards[key]
+
+    def compact(self) -> int:
+        self.ids.write(self.ids.load())
+        return sum(self.shard(key).compact() for key in self.keys())
+
+    def version(self) -> list:
+        return list(statKey(self.pathManifest))
+
+    def stamps(self) -> dict:
+        return {
+            key: [list(part) if part else None for part in self.shard(key).fileKey()]
+            for key in self.keys()
+        }
+
+
+class SqliteStorage(Storage):
+    """
+    Stores timeslots in an SQLite database.
+
+    Timeslots are indexed on start time and project, tags live in a
+    separate table indexed on tag. Every change is a single transaction.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS timeslots (
+            id TEXT PRIMARY KEY,
+            start INTEGER NOT NULL,
+            "end" INTEGER,
+            project TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS tags (
+            timeslot TEXT NOT NULL REFERENCES timeslots(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            tag TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS timeslots_start ON timeslots(start);
+        CREATE INDEX IF NOT EXISTS timeslots_project ON timeslots(project);
+        CREATE INDEX IF NOT EXISTS tags_tag ON tags(tag);
+        CREATE INDEX IF NOT EXISTS tags_timeslot ON tags(timeslot);
+    """
+
+    def __init__(self, pathDatabase: str, legacy: Storage = None) -> None:
+        """
+        If the database is created and legacy is given, the timeslots of
+        the storage it returns are migrated.
+        """
+        import sqlite3
+
+        self.pathDatabase = pathDatabase
+        created = not os.path.exists(pathDatabase)
+
+        try:
+            self.db = sqlite3.connect(pathDatabase)
+            self.db.execute("PRAGMA foreign_keys = ON")
+            self.db.executescript(self.schema)
+        except sqlite3.Error:
+            raise JaktPathError(pathDatabase)
+
+        if created and legacy is not None:
+            self.write(legacy().query())
+
+    def rows(
+        self, where: str = "", params: tuple = (), order: str = "t.rowid"
+    ) -> list[timeslot]:
+        return list(self.iterRows(where, params, order))
+
+    def iterRows(self, where: str = "", params: tuple = (), order: str = "t.rowid"):
+        """
+        Yields timeslots one by one while reading the matching rows
+        """
+        cursor = self.db.execute(
+            f"""
+            SELECT t.id, t.start, t."end", t.project, g.tag
+            FROM timeslots t LEFT JOIN tags g ON g.timeslot = t.id
+            {where}
+            ORDER BY {order}, g.position
+            """,
+            params,
+        )
+
+        last = None
+        for ID, start, end, project, tag in cursor:
+            if last is None or last[0] != ID:
+                if last is not None:
+                    yield timeslot(*last)
+                last = (ID, start, end, project, [])
+            if tag is not None:
+                last[4].append(tag)
+
+        if last is not None:
+            yield timeslot(*last)
+
+    def query(self, from_=None, to=None, project=None, tag=None) -> list[timeslot]:
+        return self.rows(*self.filters(from_, to, project, tag))
+
+    def iterate(self, from_=None, to=None, project=None, tag=None):
+        return self.iterRows(*self.filters(from_, to, project, tag))
+
+    def ordered(self):
+        return self.iterRows(order="t.start, t.rowid")
+
+    def filters(self, from_=None, to=None, project=None, tag=None) -> tuple:
+        """
+        Returns the WHERE clause, parameters and ordering for the given filters
+        """
+        conditions = []
+        params = []
+        order = "t.rowid"
+
+        if from_:
+            conditions.append("t.start >= ?")
+            params.append(timestamp(from_))
+            order = "t.start, t.rowid"
+
+        if to:
+            conditions.append("t.start < ?")
+            params.append(timestamp(to))
+            order = "t.start, t.rowid"
+
+        if project:
+            conditions.append("t.project = ?")
+            params.append(project)
+
+        if tag:
+            conditions.append("t.id IN (SELECT timeslot FROM tags WHERE tag = ?)")
+            params.append(tag)
+
+        where = ""
+        if conditions:
+            where = "WHERE " + " AND ".join(conditions)
+
+        return where, tuple(params), order
+
+    def get(self, queryId: str) -> timeslot:
+        timeslots = self.rows("WHERE t.id = ?", (queryId,))
+        if timeslots:
+            return timeslots[0]
+
+        return None
+
+    def has(self, queryId: str) -> bool:
+        cursor = self.db.execute("SELECT 1 FROM timeslots WHERE id = ?", (queryId,))
+        return cursor.fetchone() is not None
+
+    def used(self, IDs) -> set:
+        IDs = list(IDs)
+        used = set()
+
+        # Stays below the limit on query parameters
+        for i in range(0, len(IDs), 500):
+            chunk = IDs[i : i + 500]
+            cursor = self.db.execute(
+                f"SELECT id FROM timeslots WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            used.update(ID for (ID,) in cursor)
+
+        return used
+
+    def projects(self) -> list[str]:
+        cursor = self.db.execute(
+            "SELECT project FROM timeslots GROUP BY project ORDER BY MIN(rowid)"
+        )
+        return [project for (project,) in cursor]
+
+    def tags(self, project: str = None) -> list[str]:
+        if project:
+            cursor = self.db.execute(
+                """
+                SELECT g.tag FROM tags g JOIN timeslots t ON g.timeslot = t.id
+                WHERE t.project = ? GROUP BY g.tag ORDER BY MIN(g.rowid)
+                """,
+                (project,),
+            )
+        else:
+            cursor = self.db.execute(
+                "SELECT tag FROM tags GROUP BY tag ORDER BY MIN(rowid)"
+            )
+        return [tag for (tag,) in cursor]
+
+    def insert(self, ts: timeslot) -> None:
+        self.db.execute(
+            'INSERT INTO timeslots (id, start, "end", project) VALUES (?, ?, ?, ?)',
+            (ts.id, ts.start, ts.end, ts.project),
+        )
+        self.insertTags(ts)
+
+    def insertTags(self, ts: timeslot) -> None:
+        self.db.executemany(
+            "INSERT INTO tags (timeslot, position, tag) VALUES (?, ?, ?)",
+            [(ts.id, i, tag) for i, tag in enumerate(ts.tags)],
+        )
+
+    def append(self, ts: timeslot) -> None:
+        with self.db:
+            self.insert(ts)
+
+    def extend(self, timeslots: list[timeslot]) -> None:
+        with self.db:
+            for ts in timeslots:
+                self.insert(ts)
+
+    def replace(self, queryId: str, ts: timeslot) -> None:
+        self.replaceMany([(queryId, ts)])
+
+    def replaceMany(self, changes: list[tuple]) -> None:
+        with self.db:
+            for queryId, ts in changes:
+                self.db.execute("DELETE FROM tags WHERE timeslot = ?", (queryId,))
+                self.db.execute(
+                    'UPDATE timeslots SET id = ?, start = ?, "end" = ?, project = ? WHERE id = ?',
+                    (ts.id, ts.start, ts.end, ts.project, queryId),
+                )
+                self.insertTags(ts)
+
+    def remove(self, queryId: str) -> None:
+        with self.db:
+            self.db.execute("DELETE FROM timeslots WHERE id = ?", (queryId,))
+
+    def write(self, timeslots: list[timeslot]) -> None:
+        with self.db:
+            self.db.execute("DELETE FROM tags")
+            self.db.execute("DELETE FROM timeslots")
+            for ts in timeslots:
+                self.insert(ts)
+
+    def compact(self) -> int:
+        self.db.execute("VACUUM")
+        return 0
+
+    def version(self) -> list:
+        st = os.stat(self.pathDatabase)
+        return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+
+def timestamp(value) -> int:
+    """
+    Returns value as a unix timestamp, value can be a datetime or a timestamp
+    """
+    if not value:
+        return None
+
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+
+    return int(value)
+
+
+def openStorage(kind: str, dataPath: str) -> Storage:
+    """
+    Returns the storage backend named kind for the data in dataPath
+    """
+    def jsonStorage():
+        return JsonStorage(
+            os.path.join(dataPath, "timeslots"),
+            os.path.join(dataPath, "timeslots.json"),
+            os.path.join(dataPath, "timeslots.jsonl"),
+        )
+
+    if kind == "json":
+        return jsonStorage()
+
+    if kind == "sqlite":
+        return SqliteStorage(
+            os.path.join(dataPath, "timeslots.db"), legacy=jsonStorage
+        )
+
+    raise JaktError(f"Unknown storage backend '{kind}'.")
@@ -0,0 +1,625 @@
+"""
+Synchronization of timeslots with a remote, see jakt.fetch, pull and push.
+
+The remote holds the timeslots in one file per UTC month, the same
+shards as JsonStorage, named by the SHA-256 of their contents, and a
+manifest listing the hash of every shard with a revision number. Only
+shards whose hash differs are transferred.
+
+A remote is a directory, for example on a shared drive, or an HTTP
+server storing files with GET and PUT. `python -m jakt.sync PATH` serves
+a directory over HTTP.
+
+Pulling merges three versions of every changed shard: the one last
+synchronized (the base), the local one and the remote one. Records are
+matched by ID and a change on one side wins over no change on the other.
+Where both sides changed a record differently the same version is
+picked on every machine, so merges end up identical.
+"""
+import os
+import re
+import json
+import hashlib
+import calendar
+from time import time
+
+import click
+
+from .timeslot import timeslot
+from .storage import shardKey
+from .atomic import atomicWrite, FileLock
+from .exceptions import *
+
+
+MANIFEST = "manifest.json"
+
+# Names a remote stores, anything else is refused
+NAMES = re.compile(r"^(manifest\.json|shards/\d{4}-\d{2}-[0-9a-f]{64}\.json)$")
+
+
+## Shards
+def canonical(records: dict) -> bytes:
+    """
+    Returns the records of a shard, by ID, in the form that is hashed and transferred
+    """
+    return json.dumps(
+        [records[ID] for ID in sorted(records)], sort_keys=True, separators=(",", ":")
+    ).encode()
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def shardName(key: str, hash: str) -> str:
+    return f"shards/{key}-{hash}.json"
+
+
+def monthRange(key: str) -> tuple:
+    """
+    Returns the timestamps [from_, to) of the UTC month key
+    """
+    year, month = map(int, key.split("-"))
+    following = (year + month // 12, month % 12 + 1)
+
+    return (
+        calendar.timegm((year, month, 1, 0, 0, 0)),
+        calendar.timegm((*following, 1, 0, 0, 0)),
+    )
+
+
+def merge(base: dict, local: dict, remote: dict) -> tuple:
+    """
+    Merges the records, by ID, changed since base locally and remotely.
+
+    A record changed or removed on one side only takes that change. A
+    record removed on one side and changed on the other is kept. Where
+    both sides changed it differently the version whose canonical JSON
+    sorts last wins. Different records added under the same ID on both
+    sides are both kept, the losing one under an ID derived from its
+    contents.
+
+    Returns (merged records, number of conflicts).
+    """
+    merged = {}
+    conflicts = 0
+
+    for ID in sorted(set(base) | set(local) | set(remote)):
+        b = base.get(ID)
+        l = local.get(ID)
+        r = remote.get(ID)
+
+        if l == r or r == b:
+            result = l
+        elif l == b:
+            result = r
+        elif l is None or r is None:
+            result = l or r
+        else:
+            conflicts += 1
+            result, loser = sorted(
+                [l, r], key=lambda record: canonical({ID: record}), reverse=True
+            )
+            if b is None:
+                renamed = dict(loser, id=digest(canonical({ID: loser}))[:8])
+                merged[renamed["id"]] = renamed
+
+        if result is not None:
+            merged[ID] = result
+
+    return merged, conflicts
+
+
+## Remotes
+class Remote:
+    """
+    Files of a remote, read and written by name.
+    """
+
+    def read(self, name: str) -> bytes:
+        """
+        Returns the contents of name, or None if it does not exist
+        """
+        raise NotImplementedError
+
+    def write(self, name: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    def putManifest(self, manifest: dict, revision: int) -> bool:
+        """
+        Replaces the manifest if it still has revision.
+
+        Returns False if another machine pushed in the meantime.
+        """
+        raise NotImplementedError
+
+    def manifest(self) -> dict:
+        data = self.read(MANIFEST)
+        if data is None:
+            return {"revision": 0, "shards": {}}
+
+        try:
+            return json.loads(data)
+        except ValueError:
+            raise JaktRemoteError("The manifest of the remote can not be read.")
+
+    def shard(self, key: str, hash: str) -> bytes:
+        data = self.read(shardName(key, hash))
+        if data is None or digest(data) != hash:
+            raise JaktRemoteError(f"Shard {key} of the remote is missing or damaged.")
+
+        return data
+
+
+class DirectoryRemote(Remote):
+    """
+    Remote in a directory, locked with the same advisory lock as jakt data.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = FileLock(os.path.join(path, "jakt.lock"))
+
+    def read(self, name: str) -> bytes:
+        try:
+            with open(os.path.join(self.path, name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError:
+            raise JaktPathError(os.path.join(self.path, name))
+
+    def write(self, name: str, data: bytes) -> None:
+        path = os.path.join(self.path, name)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        except OSError:
+            raise JaktPathError(path)
+
+        atomicWrite(path, data)
+
+    def putManifest(self, manifest: dict, revision: int) -> bool:
+        try:
+            os.makedirs(self.path, exist_ok=True)
+        except OSError:
+            raise JaktPathError(self.path)
+
+        with self.lock():
+            if self.manifest()["revision"] != revision:
+                return False
+
+            self.write(MANIFEST, json.dumps(manifest).encode())
+            self.prune(manifest)
+
+        return True
+
+    def prune(self, manifest: dict) -> None:
+        """
+        Removes shards the manifest does not list.
+
+        Shards written in the last day are kept, they can belong to a push
+        that has not put its manifest yet.
+        """
+        used = {shardName(key, hash) for key, hash in manifest["shards"].items()}
+        directory = os.path.join(self.path, "shards")
+        for name in os.listdir(directory) if os.path.isdir(directory) else ():
+            path = os.path.join(directory, name)
+            if f"shards/{name}" in used:
+                continue
+            try:
+                if os.stat(path).st_mtime < time() - 24 * 3600:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+class HttpRemote(Remote):
+    """
+    Remote on an HTTP server answering GET and PUT for the names of NAMES.
+
+    The manifest is put with an If-Match header holding the revision it
+    replaces, the server answers 412 if it has another one.
+    """
+
+    def __init__(self, url: str) -> None:
+        self.url = url.rstrip("/")
+
+    def request(self, method: str, name: str, data: bytes = None, headers: dict = None):
+        import urllib.request
+        import urllib.error
+
+        request = urllib.request.Request(
+            f"{self.url}/{name}", data=data, method=method, headers=headers or {}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, b""
+        except (urllib.error.URLError, OSError) as e:
+            raise JaktRemoteError(f"The remote {self.url} can not be reached: {e}")
+
+    def read(self, name: str) -> bytes:
+        status, data = self.request("GET", name)
+        if status == 404:
+            return None
+        if status != 200:
+            raise JaktRemoteError(f"The remote answered {status} for {name}.")
+
+        return data
+
+    def write(self, name: str, data: bytes) -> None:
+        status, _ = self.request("PUT", name, data)
+        if status not in (200, 201, 204):
+            raise JaktRemoteError(f"The remote answered {status} for {name}.")
+
+    def putManifest(self, manifest: dict, revision: int) -> bool:
+        status, _ = self.request(
+            "PUT", MANIFEST, json.dumps(manifest).encode(), {"If-Match": str(revision)}
+        )
+        if status == 412:
+            return False
+        if status not in (200, 201, 204):
+            raise JaktRemoteError(f"The remote answered {status} for {MANIFEST}.")
+
+        return True
+
+
+def openRemote(location: str) -> Remote:
+    """
+    Returns the remote at location, a URL or a directory
+    """
+    if location.startswith(("http://", "https://")):
+        return HttpRemote(location)
+
+    return DirectoryRemote(os.path.expanduser(location))
+
+
+## Synchronization
+class Sync:
+    """
+    Synchronizes the timeslots of jkt with its remote.
+
+    The state of the last synchronization is kept in the sync directory
+    next to the data: the remote revision and shard hashes it ended at,
+    the contents of those shards as the base of the next merge and the
+    hash of every local shard with the storage stamp it was computed for.
+    """
+
+    # Pushes retried after another machine pushed first
+    attempts = 5
+
+    def __init__(self, jkt) -> None:
+        location = jkt.config.get("remote")
+        if not location:
+            raise JaktRemoteError(
+                "No remote is set, use `jakt config remote <directory or URL>`."
+            )
+
+        self.jkt = jkt
+        self.remote = openRemote(location)
+
+        self.path = os.path.join(jkt.dataPath, "sync")
+        self.pathState = os.path.join(self.path, "state.json")
+
+        self.state = {"remote": location, "revision": 0, "base": {}, "local": {}}
+        try:
+            with open(self.pathState, "r") as f:
+                state = json.load(f)
+            # Another remote starts from scratch
+            if state["remote"] == location:
+                self.state = state
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def saveState(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        atomicWrite(self.pathState, json.dumps(self.state))
+
+    ## Stored shards
+    def stored(self, key: str, hash: str) -> dict:
+        """
+        Returns the records of a shard stored in the sync directory, or {} if it is not there
+        """
+        try:
+            with open(os.path.join(self.path, shardName(key, hash)), "rb") as f:
+                return {record["id"]: record for record in json.loads(f.read())}
+        except (OSError, ValueError):
+            return {}
+
+    def has(self, key: str, hash: str) -> bool:
+        return os.path.exists(os.path.join(self.path, shardName(key, hash)))
+
+    def store(self, key: str, hash: str, data: bytes) -> None:
+        if not self.has(key, hash):
+            path = os.path.join(self.path, shardName(key, hash))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomicWrite(path, data, sync=False)
+
+    def prune(self, *manifests: dict) -> None:
+        """
+        Removes stored shards not listed in manifests
+        """
+        used = {
+            os.path.basename(shardName(key, hash))
+            for shards in manifests
+            for key, hash in shards.items()
+        }
+        directory = os.path.join(self.path, "shards")
+        for name in os.listdir(directory) if os.path.isdir(directory) else ():
+            if name not in used:
+                os.remove(os.path.join(directory, name))
+
+    ## Local shards
+    def localShards(self, keys=None) -> dict:
+        """
+        Returns the local records by ID of the shards keys, or of all shards
+        """
+        storage = self.jkt.storage
+
+        shards = {}
+        if keys is None or storage.stamps() is None:
+            for ts in storage.iterate():
+                key = shardKey(ts.start)
+                if keys is None or key in keys:
+                    shards.setdefault(key, {})[ts.id] = ts.toDict()
+            return shards
+
+        for key in keys:
+            from_, to = monthRange(key)
+            records = {ts.id: ts.toDict() for ts in storage.iterate(from_=from_, to=to)}
+            if records:
+                shards[key] = records
+
+        return shards
+
+    def localHashes(self) -> dict:
+        """
+        Returns the hash of every local shard, computed again only for shards changed since
+        """
+        stamps = self.jkt.storage.stamps()
+        cached = self.state["local"]
+
+        if stamps is None:
+            stale = None
+        else:
+            stale = [key for key in stamps if cached.get(key, {}).get("stamp") != stamps[key]]
+            if not stale:
+                return {key: cached[key]["hash"] for key in stamps}
+
+        hashes = {}
+        local = {}
+        for key, records in self.localShards(stale).items():
+            hashes[key] = digest(canonical(records))
+            if stamps is not None:
+                local[key] = {"stamp": stamps[key], "hash": hashes[key]}
+
+        if stamps is not None:
+            for key in stamps:
+                if key not in stale:
+                    hashes[key] = cached[key]["hash"]
+                    local[key] = cached[key]
+
+        self.state["local"] = local
+        return hashes
+
+    ## Operations
+    def fetch(self) -> dict:
+        """
+        Downloads the remote shards that changed since the last synchronization.
+
+        Returns the remote manifest.
+        """
+        manifest = self.remote.manifest()
+        base = self.state["base"]
+
+        for key, hash in manifest["shards"].items():
+            if base.get(key) != hash and not self.has(key, hash):
+                self.store(key, hash, self.remote.shard(key, hash))
+
+        return manifest
+
+    def pull(self) -> dict:
+        """
+        Merges the remote changes into the local timeslots.
+
+        Returns the number of local timeslots added, changed and removed
+        and the number of conflicts.
+        """
+        manifest = self.fetch()
+        result = {"added": 0, "changed": 0, "removed": 0, "conflicts": 0}
+
+        with self.jkt.lock():
+            base = self.state["base"]
+            remote = manifest["shards"]
+
+            remoteChanged = {key for key in set(base) | set(remote) if base.get(key) != remote.get(key)}
+            if remoteChanged:
+                result = self.apply(base, remote, remoteChanged)
+
+            self.state["base"] = dict(remote)
+            self.state["revision"] = manifest["revision"]
+            self.saveState()
+            self.prune(self.state["base"])
+
+        return result
+
+    def apply(self, base: dict, remote: dict, remoteChanged: set) -> dict:
+        """
+        Merges the shards changed remotely or locally and writes the result to storage
+        """
+        local = self.localHashes()
+        keys = remoteChanged | {key for key in set(base) | set(local) if base.get(key) != local.get(key)}
+
+        baseRecords = {}
+        remoteRecords = {}
+        for key in keys:
+            if key in base:
+                baseRecords.update(self.stored(key, base[key]))
+            if key in remote:
+                remoteRecords.update(self.stored(key, remote[key]))
+
+        localRecords = {}
+        for records in self.localShards(keys).values():
+            localRecords.update(records)
+
+        merged, conflicts = merge(baseRecords, localRecords, remoteRecords)
+
+        removed = [ID for ID in localRecords if ID not in merged]
+        changed = [
+            ID for ID in merged if ID in localRecords and merged[ID] != localRecords[ID]
+        ]
+        added = [ID for ID in merged if ID not in localRecords]
+
+        storage = self.jkt.storage
+
+        # Stored outside the merged shards, under the same ID
+        existing = storage.used(added)
+        changed += [ID for ID in added if ID in existing]
+        added = [ID for ID in added if ID not in existing]
+
+        old = [storage.get(ID) for ID in changed] + [
+            timeslot.from_json(localRecords[ID]) for ID in removed
+        ]
+        new = {ID: timeslot.from_json(merged[ID]) for ID in changed + added}
+
+        def write():
+            for ID in removed:
+                storage.remove(ID)
+            storage.replaceMany([(ID, new[ID]) for ID in changed])
+            storage.extend([new[ID] for ID in added])
+
+        if removed or changed or added:
+            self.jkt.change(write, added=list(new.values()), removed=old)
+
+        return {
+            "added": len(added),
+            "changed": len(changed),
+            "removed": len(removed),
+            "conflicts": conflicts,
+        }
+
+    def push(self) -> dict:
+        """
+        Pulls, then uploads the local shards that differ from the remote.
+
+        Returns the result of the pull with the number of shards pushed.
+        """
+        result = {"added": 0, "changed": 0, "removed": 0, "conflicts": 0}
+        for _ in range(self.attempts):
+            for name, count in self.pull().items():
+                result[name] += count
+
+            with self.jkt.lock(shared=True):
+                local = self.localHashes()
+                changed = {
+                    key: hash
+                    for key, hash in local.items()
+                    if self.state["base"].get(key) != hash
+                }
+                shards = self.localShards(set(changed)) if changed else {}
+
+            for key, hash in changed.items():
+                data = canonical(shards[key])
+                self.remote.write(shardName(key, hash), data)
+                self.store(key, hash, data)
+
+            if not changed and set(local) == set(self.state["base"]):
+                result["pushed"] = 0
+                return result
+
+            revision = self.state["revision"]
+            manifest = {"revision": revision + 1, "shards": local}
+            if self.remote.putManifest(manifest, revision):
+                self.state["base"] = dict(local)
+                self.state["revision"] = revision + 1
+                self.saveState()
+                self.prune(local)
+
+                result["pushed"] = len(changed)
+                return result
+
+        raise JaktRemoteError("The remote kept changing, try again.")
+
+
+## Stand-in server
+def serve(path: str, host: str = "127.0.0.1", port: int = 8765) -> None:
+    """
+    Serves the directory remote at path over HTTP until interrupted
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    remote = DirectoryRemote(path)
+
+    class Handler(BaseHTTPRequestHandler):
+        def name(self) -> str:
+            name = self.path.lstrip("/")
+            if not NAMES.match(name):
+                self.send_error(404)
+                return None
+            return name
+
+        def do_GET(self) -> None:
+            name = self.name()
+            if name is None:
+                return
+
+            data = remote.read(name)
+            if data is None:
+                self.send_error(404)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_PUT(self) -> None:
+            name = self.name()
+            if name is None:
+                return
+
+            data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            if name == MANIFEST:
+                try:
+                    manifest = json.loads(data)
+                    revision = int(self.headers.get("If-Match", ""))
+                except ValueError:
+                    self.send_error(400)
+                    return
+
+                if not remote.putManifest(manifest, revision):
+                    self.send_error(412)
+                    return
+            else:
+                if not name.endswith(f"-{digest(data)}.json"):
+                    self.send_error(400)
+                    return
+                remote.write(name, data)
+
+            self.send_response(204)
+            self.end_headers()
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+@click.command()
+@click.argument("path", type=click.Path(file_okay=False))
+@click.option("--host", default="127.0.0.1", help="Address to listen on")
+@click.option("--port", default=8765, help="Port to listen on")
+def main(path, host, port):
+    """Serves a jakt remote stored in PATH over HTTP"""
+    click.echo(f"Serving {path} on http://{host}:{port}")
+    try:
+        serve(path, host, port)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Combined reports over the data directories of several users, see `jakt team-report`.
+
+Every data directory is read in a worker process of its own, which
+returns the project and tag totals of its user, and the totals per
+period if asked for. The parent only adds these partial totals up, so
+the time taken grows with the largest directory and the number of
+directories per core rather than with their sum.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from . import jakt
+from .report import JaktReport, PeriodReport
+from .rollup import addTotals
+from .exceptions import *
+
+
+def userTotals(dataPath: str, from_=False, to=False, by=None) -> dict:
+    """
+    Returns the totals of one data directory, as computed in a worker.
+
+    "projects" holds the totals of JaktReport.totals(), "periods" the
+    data of a PeriodReport if by is given.
+    """
+    jkt = jakt(dataPath)
+
+    with jkt.lock(shared=True):
+        totals = {"projects": JaktReport.totals(jkt.storage.table(from_=from_, to=to))}
+        if by:
+            totals["periods"] = PeriodReport(jkt, by=by, from_=from_, to=to).data
+
+    return totals
+
+
+def userNames(paths: list[str]) -> list[str]:
+    """
+    Returns the name of every user, the name of their data directory.
+
+    Paths sharing a directory name are named by the full path instead.
+    """
+    names = [os.path.basename(os.path.normpath(path)) for path in paths]
+    return [
+        name if names.count(name) == 1 else os.path.normpath(path)
+        for name, path in zip(names, paths)
+    ]
+
+
+class TeamReport(JaktReport):
+    """
+    Project and tag totals over the data directories of several users.
+
+    data is the same as in JaktReport, users holds a JaktReport for every
+    user by name. If by is given periods holds a PeriodReport with the
+    totals of every user per day, week or month.
+    """
+
+    def __init__(self, paths: list[str], from_=False, to=False, by=None, workers=None):
+        if not paths:
+            raise JaktInputError("No data directories given.")
+        if by not in (None, "day", "week", "month"):
+            raise JaktInputError(f"Unknown period '{by}'.")
+
+        for path in paths:
+            # jakt() would set up a new data directory on a mistyped path
+            if not os.path.isfile(os.path.join(path, "config.yml")):
+                raise JaktPathError(path)
+
+        args = (
+            paths,
+            [from_] * len(paths),
+            [to] * len(paths),
+            [by] * len(paths),
+        )
+
+        workers = min(workers or os.cpu_count() or 1, len(paths))
+        if workers == 1:
+            results = list(map(userTotals, *args))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(userTotals, *args))
+
+        projects = {}
+        self.users = {}
+        for name, totals in zip(userNames(paths), results):
+            addTotals(projects, totals["projects"])
+
+            user = JaktReport.__new__(JaktReport)
+            user.data = self.format(totals["projects"])
+            self.users[name] = user
+
+        self.data = self.format(projects)
+
+        self.periods = None
+        if by:
+            self.periods = self.mergePeriods([totals["periods"] for totals in results])
+
+    def mergePeriods(self, userPeriods: list[list[dict]]) -> PeriodReport:
+        """
+        Returns a PeriodReport with the period totals of all users added up
+        """
+        periods = {}
+        for data in userPeriods:
+            for period in data:
+                merged = periods.get(period["from"])
+                if merged is None:
+                    merged = periods[period["from"]] = dict(period, projects={})
+                addTotals(merged["projects"], period["projects"])
+
+        report = PeriodReport.__new__(PeriodReport)
+        report.data = [periods[start] for start in sorted(periods)]
+        return report
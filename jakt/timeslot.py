@@ -1,29 +1,70 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from array import array
+from sys import intern
 import json
-import click
+import io
+
+
+def joinTags(tags: list[str]) -> str:
+    """
+    Returns tags as one ';'-separated field, '\\' and ';' in tags are escaped with '\\'
+    """
+    return ";".join(tag.replace("\\", "\\\\").replace(";", "\\;") for tag in tags)
+
+
+def splitTags(field: str) -> list[str]:
+    """
+    Returns the tags of a field written by joinTags, an empty field has no tags
+    """
+    if not field:
+        return []
+
+    tags = [""]
+    escaped = False
+    for char in field:
+        if escaped:
+            tags[-1] += char
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == ";":
+            tags.append("")
+        else:
+            tags[-1] += char
+
+    return tags
 
 
 class timeslot:
+    # Datetimes and duration are derived from the timestamps when used,
+    # project and tag strings are interned as most of them repeat.
+    __slots__ = ("id", "start", "end", "project", "tags")
+
     def __init__(self, ID: str, start: int, end: int, project: str, tags: list[str]):
         self.id = ID
 
         self.start = start
         self.end = end
-        self.start_dt = datetime.fromtimestamp(self.start)
-        if end:
-            self.end_dt = datetime.fromtimestamp(self.end)
 
-            start = datetime.fromtimestamp(self.start)
-            end = datetime.fromtimestamp(self.end)
-            self.duration = end - start
+        self.project = intern(project)
+        self.tags = [intern(tag) for tag in tags]
 
-        else:
-            self.end_dt = None
-            self.duration = None
+    @property
+    def start_dt(self) -> datetime:
+        return datetime.fromtimestamp(self.start)
+
+    @property
+    def end_dt(self) -> datetime:
+        if not self.end:
+            return None
+        return datetime.fromtimestamp(self.end)
+
+    @property
+    def duration(self) -> timedelta:
+        if not self.end:
+            return None
+        return timedelta(seconds=self.end - self.start)
 
-        self.project = project
-        self.tags = tags
-        
 
     def __str__(self):
         return f"ts: {self.id} {self.project} {self.tags} {self.start_dt.strftime('%d-%m-%y %H:%M')} - {self.end_dt.strftime('%H:%M')}"
@@ -80,17 +121,21 @@ class timeslot:
         Returns timeslot in interface friendly format
         """
 
+        start_dt = self.start_dt
+        end_dt = self.end_dt
+
         # Make sure time is readable and makes sense
-        if self.start_dt.date() == self.end_dt.date():
-            start_hr = self.start_dt.strftime("%H:%M")
+        if start_dt.date() == end_dt.date():
+            start_hr = start_dt.strftime("%H:%M")
         else:
-            start_hr = self.start_dt.strftime("%H:%M %d-%m-%y")
+            start_hr = start_dt.strftime("%H:%M %d-%m-%y")
 
-        end_hr = self.end_dt.strftime("%H:%M %d-%m-%y")
+        end_hr = end_dt.strftime("%H:%M %d-%m-%y")
 
         # Make duration human readable
-        s = str(self.duration).split(":")
-        duration = f"{int(s[0]):02}:{int(s[1]):02}:{int(s[2]):02}"
+        hh, remainder = divmod(self.end - self.start, 3600)
+        mm, ss = divmod(remainder, 60)
+        duration = f"{hh:02}:{mm:02}:{ss:02}"
 
         # Cast tags as string with spaces between.
         tags = " ".join(str(t) for t in self.tags)
@@ -100,6 +145,8 @@ class timeslot:
             return f"{self.id} {duration} ({start_hr} - {end_hr}) {self.project} {tags}"
 
         # Adds color when outputting using click.
+        import click
+
         id = click.style(self.id, fg="yellow")
         project = click.style(self.project, fg="blue", bold=True)
         
@@ -112,9 +159,73 @@ class timeslot:
 
         return returnString
 
+    def toRow(self) -> list:
+        """
+        Returns the fields of a CSV row for the timeslot, tags are joined by joinTags
+        """
+        return [self.id, self.start, self.end, self.project, joinTags(self.tags)]
+
     def toCSV(self):
         """
         Creates a CSV line for a timeslot
         """
-        return f"{self.id},{self.start},{self.end},{self.project},{self.tags}"
+        import csv
+
+        line = io.StringIO()
+        csv.writer(line, lineterminator="").writerow(self.toRow())
+        return line.getvalue()
+
+
+
+class TimeslotTable:
+    """
+    Columnar view of completed timeslots for bulk consumers.
+
+    Start and end timestamps are kept in array('q') columns, ids, projects
+    and tags in lists of the same length.
+    """
+
+    __slots__ = ("ids", "starts", "ends", "projects", "tags")
+
+    def __init__(self) -> None:
+        self.ids = []
+        self.starts = array("q")
+        self.ends = array("q")
+        self.projects = []
+        self.tags = []
+
+    @classmethod
+    def fromTimeslots(cls, timeslots: list[timeslot]):
+        """
+        Builds a table from timeslots, active timeslots are left out.
+        """
+        table = cls()
+        for ts in timeslots:
+            if ts.end is None:
+                continue
+            table.ids.append(ts.id)
+            table.starts.append(ts.start)
+            table.ends.append(ts.end)
+            table.projects.append(ts.project)
+            table.tags.append(ts.tags)
+
+        return table
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def extend(self, other) -> None:
+        """
+        Appends the rows of the table other
+        """
+        self.ids.extend(other.ids)
+        self.starts.extend(other.starts)
+        self.ends.extend(other.ends)
+        self.projects.extend(other.projects)
+        self.tags.extend(other.tags)
 
+    def durations(self) -> array:
+        """
+        Returns the duration of every timeslot in seconds
+        """
+        return array("q", [end - start for start, end in zip(self.starts, self.ends)])
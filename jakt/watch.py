@@ -0,0 +1,130 @@
+import os
+import struct
+import select
+from time import monotonic, sleep
+
+from .journal import statKey
+
+
+# inotify event mask bits, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+
+class PollWatcher:
+    """
+    Notices changes of a file by comparing its stat every interval seconds.
+    """
+
+    def __init__(self, path: str, interval: float = 1.0) -> None:
+        self.path = path
+        self.interval = interval
+        self.key = statKey(path)
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Waits until the file changes or timeout seconds passed.
+
+        Returns True if the file changed.
+        """
+        deadline = monotonic() + timeout
+        while True:
+            key = statKey(self.path)
+            if key != self.key:
+                self.key = key
+                return True
+
+            left = deadline - monotonic()
+            if left <= 0:
+                return False
+            sleep(min(self.interval, left))
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """
+    Notices changes of a file through inotify on its directory.
+
+    The directory is watched, not the file, so the file being created,
+    replaced by a rename or removed is noticed too.
+    """
+
+    header = struct.Struct("iIII")
+
+    def __init__(self, path: str) -> None:
+        import ctypes
+        import ctypes.util
+
+        self.path = path
+        self.name = os.fsencode(os.path.basename(path))
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+        mask |= IN_CREATE | IN_DELETE
+
+        directory = os.path.dirname(path) or "."
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Waits until the file changes or timeout seconds passed.
+
+        Returns True if the file changed.
+        """
+        deadline = monotonic() + timeout
+        while True:
+            left = deadline - monotonic()
+            if left <= 0:
+                return False
+
+            readable, _, _ = select.select([self.fd], [], [], left)
+            if readable and self.changed():
+                return True
+
+    def changed(self) -> bool:
+        """
+        Reads the pending events, returns True if one of them is about the file
+        """
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = self.header.unpack_from(data, offset)
+                offset += self.header.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+
+                if name == self.name:
+                    changed = True
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def watcher(path: str, interval: float = 1.0):
+    """
+    Returns an InotifyWatcher for path, or a PollWatcher where inotify is missing
+    """
+    try:
+        return InotifyWatcher(path)
+    except (OSError, AttributeError, TypeError):
+        # No libc with inotify, like on macOS and Windows
+        return PollWatcher(path, interval)